@@ -1,5 +1,6 @@
 import streamlit as st
-import snowflake.connector
+from utils.snowflake_pool import connection
+from utils.query_cache import invalidate_tables
 from datetime import datetime
 import pytz
 
@@ -220,82 +221,68 @@ st.markdown("""
 # Main header
 st.markdown('<h1 class="main-header">Road Accidents Prediction and Prevention Using AI</h1>', unsafe_allow_html=True)
 
-# Initialize connection to Snowflake
-def init_connection():
-    return snowflake.connector.connect(
-            account=st.session_state.account,
-            role=st.session_state.role,
-            warehouse=st.session_state.warehouse,
-            database=st.session_state.database,
-            schema=st.session_state.schema,
-            user=st.session_state.user,
-            password=st.session_state.password,
-            client_session_keep_alive=True
-    )
-
 # Function to insert data into Snowflake
 def insert_data(data):
-    conn = init_connection()
-    cur = conn.cursor()
+    with connection() as conn:
+        cur = conn.cursor()
     
-    query = """
-    INSERT INTO T01_ROAD_ACCIDENTS (
-        VEHICLE_NUMBER, ROAD_SURFACE_CONDITIONS, WEATHER_CONDITIONS, 
-        LIGHT_CONDITIONS, NUMBER_OF_VEHICLES, ROAD_TYPE, 
-        URBAN_OR_RURAL_AREA, VEHICLE_TYPE, DRIVER_AGE,
-        DRIVER_SEX, DRIVER_HOME_AREA_TYPE, VEHICLE_AGE,
-        SPEED_LIMIT, JUNCTION_DETAIL, JUNCTION_CONTROL,
-        PEDESTRIAN_CROSSING_HUMAN_CONTROL, PEDESTRIAN_CROSSING_PHYSICAL_FACILITIES,
-        ROAD_CLASS, TIME_OF_DAY
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """
+        query = """
+        INSERT INTO T01_ROAD_ACCIDENTS (
+            VEHICLE_NUMBER, ROAD_SURFACE_CONDITIONS, WEATHER_CONDITIONS, 
+            LIGHT_CONDITIONS, NUMBER_OF_VEHICLES, ROAD_TYPE, 
+            URBAN_OR_RURAL_AREA, VEHICLE_TYPE, DRIVER_AGE,
+            DRIVER_SEX, DRIVER_HOME_AREA_TYPE, VEHICLE_AGE,
+            SPEED_LIMIT, JUNCTION_DETAIL, JUNCTION_CONTROL,
+            PEDESTRIAN_CROSSING_HUMAN_CONTROL, PEDESTRIAN_CROSSING_PHYSICAL_FACILITIES,
+            ROAD_CLASS, TIME_OF_DAY
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
     
-    cur.execute(query, (
-        data["vehicle_number"], data["road_surface"], data["weather"],
-        data["light"], data["num_vehicles"], data["road_type"],
-        data["area"], data["vehicle_type"], data["driver_age"],
-        data["driver_sex"], data["home_area"], data["vehicle_age"],
-        data["speed_limit"], data["junction_detail"], data["junction_control"],
-        data["ped_control"], data["ped_facilities"], data["road_class"],
-        data["time_of_day"]
-    ))
+        cur.execute(query, (
+            data["vehicle_number"], data["road_surface"], data["weather"],
+            data["light"], data["num_vehicles"], data["road_type"],
+            data["area"], data["vehicle_type"], data["driver_age"],
+            data["driver_sex"], data["home_area"], data["vehicle_age"],
+            data["speed_limit"], data["junction_detail"], data["junction_control"],
+            data["ped_control"], data["ped_facilities"], data["road_class"],
+            data["time_of_day"]
+        ))
 
-    query_upd = """UPDATE T01_ROAD_ACCIDENTS TGT
-    SET 
-        TGT.ACCIDENT_PROBABILITY=SRC.PREDICTED_ACCIDENT_PROBABILITY,
-        TGT.ACCIDENT_SEVERITY=SRC.PREDICTED_SEVERITY,
-        TGT.OUTPUT=SRC.OUTPUT
-    FROM V01_PREDICTED_DATA SRC
-    WHERE SRC.VEHICLE_NUMBER = TGT.VEHICLE_NUMBER AND SRC.INSRT_TIMESTAMP=SRC.INSRT_TIMESTAMP;
-    """
-    cur.execute(query_upd)
-    conn.commit()
-    cur.close()
-    conn.close()
+        query_upd = """UPDATE T01_ROAD_ACCIDENTS TGT
+        SET 
+            TGT.ACCIDENT_PROBABILITY=SRC.PREDICTED_ACCIDENT_PROBABILITY,
+            TGT.ACCIDENT_SEVERITY=SRC.PREDICTED_SEVERITY,
+            TGT.OUTPUT=SRC.OUTPUT
+        FROM V01_PREDICTED_DATA SRC
+        WHERE SRC.VEHICLE_NUMBER = TGT.VEHICLE_NUMBER AND SRC.INSRT_TIMESTAMP=SRC.INSRT_TIMESTAMP;
+        """
+        cur.execute(query_upd)
+        conn.commit()
+        cur.close()
+    invalidate_tables("T01_ROAD_ACCIDENTS")
 
 
 
 # Function to get prediction results
 def get_prediction_results(vehicle_number):
-    conn = init_connection()
-    cur = conn.cursor()
+    with connection() as conn:
+        cur = conn.cursor()
     
-    query = """
-    SELECT VEHICLE_NUMBER, INSRT_TIMESTAMP, ACCIDENT_PROBABILITY, 
-           ACCIDENT_SEVERITY, OUTPUT 
-    FROM T01_ROAD_ACCIDENTS 
-    WHERE (VEHICLE_NUMBER, INSRT_TIMESTAMP) IN (
-        SELECT VEHICLE_NUMBER, MAX(INSRT_TIMESTAMP) INSRT_TIMESTAMP  
+        query = """
+        SELECT VEHICLE_NUMBER, INSRT_TIMESTAMP, ACCIDENT_PROBABILITY, 
+               ACCIDENT_SEVERITY, OUTPUT 
         FROM T01_ROAD_ACCIDENTS 
-        WHERE VEHICLE_NUMBER = %s 
-        GROUP BY ALL
-    )
-    """
+        WHERE (VEHICLE_NUMBER, INSRT_TIMESTAMP) IN (
+            SELECT VEHICLE_NUMBER, MAX(INSRT_TIMESTAMP) INSRT_TIMESTAMP  
+            FROM T01_ROAD_ACCIDENTS 
+            WHERE VEHICLE_NUMBER = %s 
+            GROUP BY ALL
+        )
+        """
     
-    cur.execute(query, (vehicle_number,))
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
+        cur.execute(query, (vehicle_number,))
+        result = cur.fetchone()
+        cur.close()
     
     return result
 
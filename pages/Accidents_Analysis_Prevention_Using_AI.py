@@ -2,42 +2,18 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import snowflake.connector
+from utils.snapshot_store import read_table
 
 
 
 
 
-def execute_query(query):
-    try:
-        conn = snowflake.connector.connect(
-            account=st.session_state.account,
-            role=st.session_state.role,
-            warehouse=st.session_state.warehouse,
-            database=st.session_state.database,
-            schema=st.session_state.schema,
-            user=st.session_state.user,
-            password=st.session_state.password,
-            client_session_keep_alive=True
-        )
-        cursor = conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchall()
-        columns = [col[0] for col in cursor.description] 
-        conn.close()
-        result_df = pd.DataFrame(result, columns=columns)
-        return result_df
-    except Exception as e:
-        st.error(f"Error executing query: {str(e)}")
-        return None
 
 
 st.title(":blue[🚗 Road Accidents Analysis in India (2019-2022)]")
 
 def create_accident_visualization():
-    Q1=f'''SELECT * FROM IND_DB.IND_SCH.T01_ROAD_ACC_2019_2022'''
-    # R1 = execute_query(Q1)
-    R1 = pd.read_csv('src/T01_ROAD_ACC_2019_2022.csv')
+    R1 = read_table("T01_ROAD_ACC_2019_2022")
     r1_expander = st.expander("Data sets used in this entire analysis.")
     R1_DF = pd.DataFrame(R1)
     R1_DF.index = R1_DF.index + 1
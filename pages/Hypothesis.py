@@ -1,9 +1,7 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import time
-import snowflake.connector
-from snowflake.connector.pandas_tools import write_pandas
+from utils.snapshot_store import read_table
 
 
 st.logo(
@@ -45,49 +43,7 @@ def store_credentials():
     st.session_state.user = db_credentials["user"]
     st.session_state.password = db_credentials["password"]
 
-def create_snowflake_connection():
-    try:
-        conn = snowflake.connector.connect(
-            account=st.session_state.account,
-            role=st.session_state.role,
-            warehouse=st.session_state.warehouse,
-            database=st.session_state.database,
-            schema=st.session_state.schema,
-            user=st.session_state.user,
-            password=st.session_state.password,
-            client_session_keep_alive=True
-        )
-        st.toast("Connection to Snowflake successfully!", icon='🎉')
-        time.sleep(.5)
-        st.balloons()
-    except Exception as e:
-        st.error(f"Error connecting to Snowflake: {str(e)}")
-    return conn
-
-def execute_query(query):
-    try:
-        conn = snowflake.connector.connect(
-            account=st.session_state.account,
-            role=st.session_state.role,
-            warehouse=st.session_state.warehouse,
-            database=st.session_state.database,
-            schema=st.session_state.schema,
-            user=st.session_state.user,
-            password=st.session_state.password,
-            client_session_keep_alive=True
-        )
-        cursor = conn.cursor()
-        cursor.execute(f"USE DATABASE {st.session_state.database}")
-        cursor.execute(f"USE SCHEMA {st.session_state.schema}")
-        cursor.execute(query)
-        result = cursor.fetchall()
-        columns = [col[0] for col in cursor.description]
-        conn.close()
-        result_df = pd.DataFrame(result, columns=columns)
-        return result_df
-    except Exception as e:
-        st.error(f"Error executing query: {str(e)}")
-        return None
+
 
 
 
@@ -159,9 +115,7 @@ st.markdown("""---------------------------------""")
 
 # Creating the budget allocation data as a DataFrame
 st.title("Budget Allocation in infrastructure(in lakh crore) by Financial Year")
-Q1='''SELECT * FROM IND_DB.IND_SCH.T01_INFRASTRUCTURE_BUDGET'''
-# R1 = execute_query(Q1)
-R1 = pd.read_csv('src/T01_INFRASTRUCTURE_BUDGET.csv')
+R1 = read_table("T01_INFRASTRUCTURE_BUDGET")
 r1_expander = st.expander("Budget Allocation Data")
 R1_DF = pd.DataFrame(R1)
 R1_DF.index = R1_DF.index + 1
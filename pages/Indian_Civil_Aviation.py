@@ -3,42 +3,18 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import snowflake.connector
-
-
-
-
-
-
-def execute_query(query):
-    try:
-        conn = snowflake.connector.connect(
-            account=st.session_state.account,
-            role=st.session_state.role,
-            warehouse=st.session_state.warehouse,
-            database=st.session_state.database,
-            schema=st.session_state.schema,
-            user=st.session_state.user,
-            password=st.session_state.password,
-            client_session_keep_alive=True
-        )
-        cursor = conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchall()
-        columns = [col[0] for col in cursor.description] 
-        conn.close()
-        result_df = pd.DataFrame(result, columns=columns)
-        return result_df
-    except Exception as e:
-        st.error(f"Error executing query: {str(e)}")
-        return None
+from utils.snapshot_store import read_table
+
+
+
+
+
+
     
 
 st.title(":blue[ ✈️ Civil Aviation Analysis 1990-2019 ✈️]")
 
-Q1=f'''SELECT * FROM  IND_DB.IND_SCH.V01_CIVIL_AVIATION_PASSENGER'''
-# R1 = execute_query(Q1)
-R1 = pd.read_csv('src/V01_CIVIL_AVIATION_PASSENGER.csv')
+R1 = read_table("V01_CIVIL_AVIATION_PASSENGER")
 r1_expander = st.expander("Data sets used in this entire analysis.")
 R1_DF = pd.DataFrame(R1)
 R1_DF.index = R1_DF.index + 1
@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import snowflake.connector
+from utils.query_loader import load_all
+from utils.snapshot_store import read_table
 
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -11,36 +12,16 @@ import plotly.graph_objects as go
 
 
 
-def execute_query(query):
-    try:
-        conn = snowflake.connector.connect(
-            account=st.session_state.account,
-            role=st.session_state.role,
-            warehouse=st.session_state.warehouse,
-            database=st.session_state.database,
-            schema=st.session_state.schema,
-            user=st.session_state.user,
-            password=st.session_state.password,
-            client_session_keep_alive=True
-        )
-        cursor = conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchall()
-        columns = [col[0] for col in cursor.description] 
-        conn.close()
-        result_df = pd.DataFrame(result, columns=columns)
-        return result_df
-    except Exception as e:
-        st.error(f"Error executing query: {str(e)}")
-        return None
     
 
 
 st.title(":blue[ 🛣️ Indian Roads development (in KM) 2001-2023]")
-Q1=f'''SELECT INDIAN_ROAD_CATEGORY, "2001", "2002", "2003", "2004", "2005", "2006", "2007", "2008", "2009", "2010", "2011", "2012", "2013", "2014", "2015", "2016", "2017", "2018", "2019", "2020", "2021", "2022", "2023" FROM IND_DB.IND_SCH.T01_INDIAN_ROADS'''
-
-# R1 = execute_query(Q1)
-R1 = pd.read_csv('src/T01_INDIAN_ROADS.csv')
+# Both datasets are independent of each other, so read them together.
+DATA = load_all({
+    "roads": lambda: read_table("T01_INDIAN_ROADS"),
+    "registrations": lambda: read_table("V01_IND_AUTOMOBILE_REGISTRATION_DATA"),
+})
+R1 = DATA["roads"]
 r1_expander = st.expander("Data sets used in this entire analysis.")
 R1_DF = pd.DataFrame(R1)
 R1_DF.index = R1_DF.index + 1
@@ -75,12 +56,7 @@ st.plotly_chart(fig)
 st.markdown("""------------""")
 
 st.title(":blue[Vehicle Registration Analysis 2018-2021]")
-Q1=f'''SELECT *
-FROM
-    IND_DB.IND_SCH.V01_IND_AUTOMOBILE_REGISTRATION_DATA
-     '''
-R1 = pd.read_csv('src/V01_IND_AUTOMOBILE_REGISTRATION_DATA.csv')
-# R1 = execute_query(Q1)
+R1 = DATA["registrations"]
 r1_expander = st.expander("Data sets used in this entire analysis.")
 R1_DF = pd.DataFrame(R1)
 R1_DF.index = R1_DF.index + 1
@@ -104,10 +80,7 @@ bar_chart = px.bar(
 )
 st.plotly_chart(bar_chart)
 st.write("#### All-India Registrations Over the Years")
-Q2=f'''SELECT TITLE,YEAR,INDIA FROM     IND_DB.IND_SCH.V01_IND_AUTOMOBILE_REGISTRATION_DATA
-     WHERE TITLE='{title}'
-     '''
-R2 = execute_query(Q2)
+R2 = read_table("V01_IND_AUTOMOBILE_REGISTRATION_DATA", columns=["TITLE", "YEAR", "INDIA"], filters=[("TITLE", "=", title)])
 r2_expander = st.expander("Data sets used in this entire analysis.")
 R2_DF = pd.DataFrame(R2)
 R2_DF.index = R2_DF.index + 1
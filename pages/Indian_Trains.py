@@ -3,42 +3,18 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import snowflake.connector
-
-
-
-
-
-
-def execute_query(query):
-    try:
-        conn = snowflake.connector.connect(
-            account=st.session_state.account,
-            role=st.session_state.role,
-            warehouse=st.session_state.warehouse,
-            database=st.session_state.database,
-            schema=st.session_state.schema,
-            user=st.session_state.user,
-            password=st.session_state.password,
-            client_session_keep_alive=True
-        )
-        cursor = conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchall()
-        columns = [col[0] for col in cursor.description] 
-        conn.close()
-        result_df = pd.DataFrame(result, columns=columns)
-        return result_df
-    except Exception as e:
-        st.error(f"Error executing query: {str(e)}")
-        return None
+from utils.snapshot_store import read_table
+
+
+
+
+
+
     
 
 
 
-Q1=f'''select INDIAN_RAILWAYS_PASSESNGER_CATEGORY as CATEGORY, "1971", "1972", "1973", "1974", "1975", "1976", "1977", "1978", "1979", "1980", "1981", "1982", "1983", "1984", "1985", "1986", "1987", "1988", "1989", "1990", "1991", "1992", "1993", "1994", "1995", "1996", "1997", "1998", "1999", "2000", "2001", "2002", "2003", "2004", "2005", "2006", "2007", "2008", "2009", "2010", "2011", "2012", "2013", "2014", "2015", "2016", "2017", "2018", "2019", "2020", "2021", "2022" from IND_DB.IND_SCH.T01_INDIAN_RAILWAYS_PASSESNGER_CATEGORY'''
-# R1 = execute_query(Q1)
-R1 = pd.read_csv('src/T01_INDIAN_RAILWAYS_PASSESNGER_CATEGORY.csv')
+R1 = read_table("T01_INDIAN_RAILWAYS_PASSESNGER_CATEGORY")
 r1_expander = st.expander("Data sets used in this entire analysis.")
 R1_DF = pd.DataFrame(R1)
 R1_DF.index = R1_DF.index + 1
@@ -1,5 +1,6 @@
 import streamlit as st
-import snowflake.connector
+from utils.query_loader import load_all
+from utils.snapshot_store import read_table
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
@@ -7,33 +8,14 @@ import numpy as np
 
 
 
-def execute_query(query):
-    try:
-        conn = snowflake.connector.connect(
-            account='yy95703.ap-south-1.aws',
-            role=st.session_state.role,
-            warehouse=st.session_state.warehouse,
-            database=st.session_state.database,
-            schema=st.session_state.schema,
-            user=st.session_state.user,
-            password=st.session_state.password,
-            client_session_keep_alive=True
-        )
-        cursor = conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchall()
-        columns = [col[0] for col in cursor.description] 
-        conn.close()
-        result_df = pd.DataFrame(result, columns=columns) 
-        return result_df
-    except Exception as e:
-        st.error(f"Error executing query: {str(e)}")
-        return None
-    
+# Everything this page reads, fetched concurrently up front from the local snapshots.
+DATA = load_all({
+    "history": lambda: read_table("T01_IND_OIL_DEPENDENCY"),
+    "forecast": lambda: read_table("V01_IND_OIL_DEPENDENCY_FORECAST_2050"),
+})
+
 st.title(":blue[⛽ Petrol Need Prediction Till 2050 ]" )
-Q1='''SELECT * FROM IND_DB.IND_SCH.T01_IND_OIL_DEPENDENCY'''
-# R1 = execute_query(Q1)
-R1 = pd.read_csv('src/T01_IND_OIL_DEPENDENCY.csv')
+R1 = DATA["history"]
 r1_expander = st.expander("Data sets used in this entire analysis.")
 R1_DF = pd.DataFrame(R1)
 R1_DF.index = R1_DF.index + 1
@@ -93,8 +75,7 @@ st.plotly_chart(fig, use_container_width=True)
 
 
 
-Q1='''SELECT * FROM IND_DB.IND_SCH.V01_IND_OIL_DEPENDENCY_FORECAST_2050'''
-R1 = execute_query(Q1)
+R1 = DATA["forecast"]
 r1_expander = st.expander("Data sets used in this entire analysis.")
 R1_DF = pd.DataFrame(R1)
 R1_DF.index = R1_DF.index + 1
@@ -230,8 +211,7 @@ with col2:
 # Trend Analysis
 st.header("📈 Production and Import Trend Analysis")
 
-Q1='''SELECT * FROM IND_DB.IND_SCH.T01_IND_OIL_DEPENDENCY'''
-R1 = execute_query(Q1)
+R1 = DATA["history"]
 r1_expander = st.expander("Data sets used in this entire analysis.")
 R1_DF = pd.DataFrame(R1)
 R1_DF.index = R1_DF.index + 1
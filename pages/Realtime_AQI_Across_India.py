@@ -1,8 +1,15 @@
 import streamlit as st
 import pandas as pd
-import requests
 import plotly.express as px
-import snowflake.connector
+import pydeck as pdk
+from utils.snapshot_store import read_distinct, read_page, read_table
+from utils.aqi_poller import POLL_INTERVAL, get_aqi_poller
+from utils.aqi_alerts import read_alerts
+from utils.aqi_pipeline import STATUS_POLL_INTERVAL, get_aqi_pipeline
+from utils.aqi_retention import HOURLY_RETENTION_DAYS, RAW_RETENTION_DAYS, RetentionPolicy
+from utils.downsample import downsample
+from utils.aqi_rollups import read_rollup
+from utils.aqi_grid import MAP_METRICS, station_frame, surface_tiles
 from datetime import datetime
 import pytz
 ist_timezone = pytz.timezone('Asia/Kolkata')
@@ -14,206 +21,89 @@ with col1:
 with col2:
     st.image("./src/DH2.PNG", caption="This is Now", use_column_width=True)
 
-# Function to fetch AQI data
-def get_aqi_data(city, api_key):
-    url = f"http://api.weatherapi.com/v1/current.json?key={api_key}&q={city}&aqi=yes"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return None
-
-# Function to categorize PM2.5 levels based on DEFRA Index
-def categorize_pm25_defra(pm25_value):
-    if pm25_value <= 11:
-        return "Low (1)"
-    elif pm25_value <= 23:
-        return "Low (2)"
-    elif pm25_value <= 35:
-        return "Low (3)"
-    elif pm25_value <= 41:
-        return "Moderate (4)"
-    elif pm25_value <= 47:
-        return "Moderate (5)"
-    elif pm25_value <= 53:
-        return "Moderate (6)"
-    elif pm25_value <= 58:
-        return "High (7)"
-    elif pm25_value <= 64:
-        return "High (8)"
-    elif pm25_value <= 70:
-        return "High (9)"
-    else:
-        return "Very High (10)"
-
-def execute_query(query):
-    try:
-        conn = snowflake.connector.connect(
-            account=st.session_state.account,
-            role=st.session_state.role,
-            warehouse=st.session_state.warehouse,
-            database=st.session_state.database,
-            schema=st.session_state.schema,
-            user=st.session_state.user,
-            password=st.session_state.password,
-            client_session_keep_alive=True
-        )
-        cursor = conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchall()
-        columns = [col[0] for col in cursor.description] 
-        conn.close()
-        result_df = pd.DataFrame(result, columns=columns)
-        return result_df
-    except Exception as e:
-        st.error(f"Error executing query: {str(e)}")
-        return None
-
-# Create Snowflake table
-def create_table():
-    create_table_query = """
-    CREATE TABLE IF NOT EXISTS T01_AQI_FOR_INDIAN_STATES (
-        State VARCHAR,
-        City VARCHAR,
-        PM25 FLOAT,
-        PM25_Category VARCHAR,
-        PM10 FLOAT,
-        CO FLOAT,
-        O3 FLOAT,
-        NO2 FLOAT,
-        SO2 FLOAT,
-        US_EPA_Index FLOAT,
-        INSRT_TIMESTAMP TIMESTAMP_NTZ DEFAULT CONVERT_TIMEZONE('Asia/Kolkata', CURRENT_TIMESTAMP)
-    )
-    """
-    execute_query(create_table_query)
-
-# Insert data into Snowflake
-def insert_data_to_snowflake(dataframe):
-    try:
-        conn = snowflake.connector.connect(
-            account=st.session_state.account,
-            role=st.session_state.role,
-            warehouse=st.session_state.warehouse,
-            database=st.session_state.database,
-            schema=st.session_state.schema,
-            user=st.session_state.user,
-            password=st.session_state.password,
-            client_session_keep_alive=True
-        )
-        cursor = conn.cursor()
-        insert_query = """
-        INSERT INTO T01_AQI_FOR_INDIAN_STATES (
-            State, City, PM25, PM25_Category, PM10, CO, O3, NO2, SO2, US_EPA_Index
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        for _, row in dataframe.iterrows():
-            cursor.execute(insert_query, (
-                row["State"], row["City"], row["PM2.5 (μg/m³)"],
-                row["PM2.5 Category (DEFRA)"], row["PM10 (μg/m³)"],
-                row["CO (μg/m³)"], row["O3 (μg/m³)"], row["NO2 (μg/m³)"],
-                row["SO2 (μg/m³)"], row["US-EPA Index"]
-            ))
-        conn.commit()
-        st.success(f"AQI data fetched as on IST Time: {current_time_ist}")
-        st.balloons()
-        conn.close()
-    except Exception as e:
-        st.error(f"Error inserting data to Snowflake: {str(e)}")
-
-state_city_mapping = {
-    "Andhra Pradesh": "Vijayawada",
-    "Arunachal Pradesh": "Itanagar",
-    "Assam": "Guwahati",
-    "Bihar": "Patna",
-    "Chhattisgarh": "Raipur",
-    "Delhi": "New Delhi",
-    "Goa": "Panaji",
-    "Gujarat": "Ahmedabad",
-    "Haryana": "Chandigarh",
-    "Himachal Pradesh": "Shimla",
-    "Jharkhand": "Ranchi",
-    "Karnataka": "Bengaluru",
-    "Kerala": "Thiruvananthapuram",
-    "Madhya Pradesh": "Bhopal",
-    "Maharashtra": "Mumbai",
-    "Manipur": "Imphal",
-    "Meghalaya": "Shillong",
-    "Mizoram": "Aizawl",
-    "Nagaland": "Kohima",
-    "Odisha": "Bhubaneswar",
-    "Punjab": "Amritsar",
-    "Rajasthan": "Jaipur",
-    "Sikkim": "Gangtok",
-    "Tamil Nadu": "Chennai",
-    "Telangana": "Hyderabad",
-    "Tripura": "Agartala",
-    "Uttar Pradesh": "Lucknow",
-    "Uttarakhand": "Dehradun",
-    "West Bengal": "Kolkata",
-    "Andaman and Nicobar Islands": "Sri Vijaya Puram",
-    "Chandigarh": "Chandigarh",
-    "Dadra and Nagar Haveli and Daman & Diu": "Daman",
-    "Jammu & Kashmir": "Srinagar",
-    "Jammu & Kashmir": "Jammu",
-    "Ladakh": "Leh",
-    "Lakshadweep": "Kavaratti",
-    "Puducherry": "Puducherry",
-}
-
 # API Key
 db_credentials = st.secrets["db_credentials"]
 api_key = db_credentials["weatherapi_key"]
 
-# Fetch AQI data
-state_aqi_data = []
-for state, city in state_city_mapping.items():
-    aqi_response = get_aqi_data(city, api_key)
-    if aqi_response and "current" in aqi_response and "air_quality" in aqi_response["current"]:
-        air_quality = aqi_response["current"]["air_quality"]
-        pm25_value = air_quality.get("pm2_5", "N/A")
-        if pm25_value != "N/A":
-            pm25_value = float(pm25_value)
-            defra_category = categorize_pm25_defra(pm25_value)
-        else:
-            defra_category = "N/A"
-        state_aqi_data.append({
-            "State": state, "City": city, "PM2.5 (μg/m³)": pm25_value,
-            "PM2.5 Category (DEFRA)": defra_category,
-            "PM10 (μg/m³)": air_quality.get("pm10", "N/A"),
-            "CO (μg/m³)": air_quality.get("co", "N/A"),
-            "O3 (μg/m³)": air_quality.get("o3", "N/A"),
-            "NO2 (μg/m³)": air_quality.get("no2", "N/A"),
-            "SO2 (μg/m³)": air_quality.get("so2", "N/A"),
-            "US-EPA Index": air_quality.get("us-epa-index", "N/A"),
-        })
-
-# Convert to DataFrame
-df = pd.DataFrame(state_aqi_data)
-df = df[df["PM2.5 (μg/m³)"] != "N/A"]
-df["PM2.5 (μg/m³)"] = pd.to_numeric(df["PM2.5 (μg/m³)"])
+# Readings come from the background poller; reruns never call weatherapi.
+# With aqi_poll_shards > 1, stations are split across that many poller processes
+# (this server, other servers or `python -m utils.aqi_poller --shards N`).
+aqi_poller = get_aqi_poller(api_key, db_credentials.get("aqi_poll_interval", POLL_INTERVAL),
+                            db_credentials.get("aqi_poll_shards", 1), db_credentials.get("aqi_alert_webhook"))
 
 # Visualization
 st.title(":blue[ India LIVE AQI Dashboard 🌍]")
 st.subheader(":blue[Real-time Air Quality Index (AQI) across Indian states.]")
-
-
+failed_cities = aqi_poller.failed_cities()
+if failed_cities:
+    st.caption(f"Latest AQI sweep is partial, no reading for: {', '.join(failed_cities)}")
+recent_alerts = read_alerts(limit=20)
+if not recent_alerts.empty:
+    alerts_expander = st.expander(f"Recent AQI alerts ({len(recent_alerts)})")
+    alerts_expander.dataframe(recent_alerts, hide_index=True)
+
+
+
+# Every sweep is spooled locally; a background worker loads the spool into
+# Snowflake and refreshes the dynamic table. The page only shows how far the
+# latest flush has got.
+aqi_pipeline = get_aqi_pipeline(
+    st.session_state.account, st.session_state.user, st.session_state.password,
+    RetentionPolicy(
+        raw_days=db_credentials.get("aqi_raw_retention_days", RAW_RETENTION_DAYS),
+        hourly_days=db_credentials.get("aqi_hourly_retention_days", HOURLY_RETENTION_DAYS),
+    ),
+)
 
 if st.button("Fetch and push latest AQI Data to snowflake"):
-    create_table()
-    insert_data_to_snowflake(df)
-    DY_REFRESH=f'''ALTER DYNAMIC TABLE IDENTIFIER('IND_DB.IND_SCH.T01_DYNAMIC_AQI_FOR_INDIAN_STATES') REFRESH'''
-    execute_query(DY_REFRESH)
+    df, fetched_at = aqi_poller.latest()
+    if df is None:
+        df, fetched_at = aqi_poller.poll()
+    current_time_ist = datetime.fromtimestamp(fetched_at, ist_timezone).strftime("%Y-%m-%d %H:%M:%S")
+    aqi_pipeline.flush()
+    st.success(f"AQI data fetched as on IST Time: {current_time_ist}")
+    st.balloons()
+
+
+last_run = aqi_pipeline.last_run()
+# Taken as a value now: last_run is the object the worker keeps updating, so
+# reading its stage inside the fragment would already see the run finished.
+polling = last_run is not None and last_run.active
+
+
+@st.fragment(run_every=STATUS_POLL_INTERVAL if polling else None)
+def pipeline_status():
+    run = aqi_pipeline.last_run()
+    pending = aqi_pipeline.pending()
+    if run is None:
+        if pending:
+            st.caption(f"{pending} AQI readings spooled, waiting to be pushed to Snowflake")
+        return
+    if run.stage == "failed":
+        st.error(f"Error pushing AQI data to Snowflake, {pending} readings kept in the local spool: {run.error}")
+    elif run.stage == "done":
+        st.caption(f"{run.rows} rows loaded in {run.batches} batches and dashboard refreshed in {run.elapsed:.0f}s"
+                   + (f"; {pending} readings spooled since" if pending else ""))
+    else:
+        detail = f" ({run.query_status})" if run.query_status else ""
+        st.caption(f"Pushing AQI data: {run.stage}{detail}, {run.rows} rows, {run.elapsed:.0f}s so far")
+    if polling and not run.active:
+        # Rerun the whole page: it picks up the refreshed rows now rather than
+        # on the next interaction, and stops polling.
+        st.rerun()
+
 
+pipeline_status()
 
-Q1=f'''SELECT * FROM IND_DB.IND_SCH.T01_DYNAMIC_AQI_FOR_INDIAN_STATES'''
-R1 = execute_query(Q1)
-r1_expander = st.expander("Data sets used in this entire analysis.")
-R1_DF = pd.DataFrame(R1)
-R1_DF.index = R1_DF.index + 1
-r1_expander.write(R1_DF)
+retention, retention_error = aqi_pipeline.last_retention()
+if retention_error:
+    st.caption(f"AQI retention failed, will retry after the next batch: {retention_error}")
+elif retention is not None:
+    ran_at = datetime.fromtimestamp(retention.ran_at, ist_timezone).strftime("%Y-%m-%d %H:%M")
+    reclaimed = (retention.warehouse_bytes_reclaimed + retention.snapshot_bytes_reclaimed) / 2**20
+    st.caption(f"Retention ran {ran_at}: {retention.raw_rows_compacted} raw and "
+               f"{retention.hourly_rows_compacted} hourly rows compacted, {reclaimed:.1f} MiB reclaimed")
 
-df=R1_DF
 
 # Custom CSS
 st.markdown("""
@@ -246,16 +136,84 @@ st.markdown("""
 default_state = "Delhi"
 default_city = "New Delhi"
 
-# Sidebar Filters
-state_filter = st.selectbox("Select CITY", df["CITY"].unique(), index=df["CITY"].unique().tolist().index(default_city))
+# Only the chosen city, time window and plotted columns are read, so the page
+# payload stays flat as history accumulates.
+AQI_TABLE_NAME = "T01_DYNAMIC_AQI_FOR_INDIAN_STATES"
+AQI_COLUMNS = [
+    "CITY", "INSRT_TIMESTAMP", "PM25", "PM25_CATEGORY", "PM10", "CO", "O3", "NO2", "SO2",
+    "US_EPA_INDEX", "AQI", "AIR_QUALITY",
+]
+TIME_WINDOWS = {"Last 24 hours": 1, "Last 7 days": 7, "Last 30 days": 30, "All time": None}
+ROLLUP_GRAINS = {"Last 30 days": "hourly", "All time": "daily"}
+PAGE_SIZES = [25, 50, 100, 250]
+# Unique per reading: a city can have stations in two states (Chandigarh), and
+# rows loaded together can share a timestamp, so INSRT_TIMESTAMP alone ties.
+HISTORY_KEY = ["INSRT_TIMESTAMP", "STATE", "CITY"]
+
+
+@st.fragment
+def history_viewer(city):
+    # Keyset pagination on HISTORY_KEY, newest first. Only the cursors of
+    # the pages visited are kept in the session, never the rows themselves.
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key="aqi_history_page_size")
+    state = st.session_state.get("aqi_history")
+    if state is None or state["city"] != city or state["page_size"] != page_size:
+        state = st.session_state["aqi_history"] = {"city": city, "page_size": page_size, "cursors": [None]}
+    cursors = state["cursors"]
+    # One extra row tells whether an older page exists.
+    page = read_page(AQI_TABLE_NAME, HISTORY_KEY, page_size + 1, after=cursors[-1],
+                     columns=AQI_COLUMNS, filters=[("CITY", "=", city)])
+    if page is None:
+        return
+    has_older = len(page) > page_size
+    page = page.head(page_size)
+    page.index = page.index + 1 + (len(cursors) - 1) * page_size
+    st.dataframe(page)
+
+    newer_col, position_col, older_col = st.columns([1, 2, 1])
+    if newer_col.button("← Newer", disabled=len(cursors) == 1, key="aqi_history_newer"):
+        cursors.pop()
+        st.rerun(scope="fragment")
+    position_col.caption(f"Page {len(cursors)}")
+    if older_col.button("Older →", disabled=not has_older, key="aqi_history_older"):
+        cursors.append(tuple(page[HISTORY_KEY].iloc[-1]))
+        st.rerun(scope="fragment")
 
-# Filter Data
-filtered_data = df[(df["CITY"] == state_filter)]
 
+# Sidebar Filters
+cities = read_distinct(AQI_TABLE_NAME, "CITY") or []
+state_filter = st.selectbox("Select CITY", cities, index=cities.index(default_city) if default_city in cities else 0)
+time_window = st.selectbox("Time window", list(TIME_WINDOWS), index=1)
 
-if not filtered_data.empty:
+# Filter Data
+filters = [("CITY", "=", state_filter)]
+since = None
+if TIME_WINDOWS[time_window] is not None:
+    # INSRT_TIMESTAMP is stored as naive IST.
+    since = pd.Timestamp.now(tz=ist_timezone).tz_localize(None) - pd.Timedelta(days=TIME_WINDOWS[time_window])
+
+# Long windows chart the hourly/daily rollup means instead of the raw readings.
+trend_grain = ROLLUP_GRAINS.get(time_window)
+filtered_data = pd.DataFrame(columns=AQI_COLUMNS)
+if trend_grain:
+    rollup = read_rollup(trend_grain, filters=filters + ([("BUCKET", ">=", since)] if since is not None else []))
+    if not rollup.empty:
+        filtered_data = (rollup.pivot_table(index="BUCKET", columns="POLLUTANT", values="MEAN")
+                         .rename_axis(index="INSRT_TIMESTAMP", columns=None).reset_index())
+if filtered_data.empty:
+    trend_grain = None
+    raw = read_table(AQI_TABLE_NAME, columns=AQI_COLUMNS,
+                     filters=filters + ([("INSRT_TIMESTAMP", ">=", since)] if since is not None else []))
+    if raw is not None:
+        filtered_data = raw
+filtered_data = filtered_data.sort_values("INSRT_TIMESTAMP").reset_index(drop=True)
+filtered_data.index = filtered_data.index + 1
+latest = read_page(AQI_TABLE_NAME, "INSRT_TIMESTAMP", 1, columns=AQI_COLUMNS, filters=filters)
+
+
+if latest is not None and not latest.empty:
     # Metrics Section
-    latest_entry = filtered_data.iloc[-1]
+    latest_entry = latest.iloc[0]
     st.subheader(f"Air Quality Metrics for  {state_filter} as of :  {latest_entry['INSRT_TIMESTAMP']}")
     
     # metric_html = f"""
@@ -296,29 +254,54 @@ if not filtered_data.empty:
     
     # Historical Data Table
     st.write("### Historical Data")
-    st.dataframe(filtered_data)
+    history_viewer(state_filter)
     
     # Visualizations
     st.write("### Trend Air Quality Data Over Time")
     # st.line_chart(filtered_data.set_index("INSRT_TIMESTAMP")[["PM25", "PM10", "CO", "O3", "NO2", "SO2"]])
 
     # Create a line chart with Plotly
-    fig = px.line(filtered_data, x='INSRT_TIMESTAMP', y=["PM25", "PM10", "CO", "O3", "NO2", "SO2"],
+    # Charts get at most MAX_POINTS points per series whatever the time window.
+    pollutant_trend = downsample(filtered_data, "INSRT_TIMESTAMP", ["PM25", "PM10", "CO", "O3", "NO2", "SO2"])
+    fig = px.line(pollutant_trend, x='INSRT_TIMESTAMP', y="value", color="variable",
                 labels={"INSRT_TIMESTAMP": "Timestamp", "value": "Concentration (µg/m³)"},
-                title="Air Quality Data Over Time", markers=True)
+                title="Air Quality Data Over Time" + (f" ({trend_grain} mean)" if trend_grain else ""), markers=True)
 
     # Display the plot
     st.plotly_chart(fig, use_container_width=True)
 
-    fig_aqi = px.line(filtered_data, x='INSRT_TIMESTAMP', y=["AQI"],
+    aqi_trend = downsample(filtered_data, "INSRT_TIMESTAMP", ["AQI"])
+    fig_aqi = px.line(aqi_trend, x='INSRT_TIMESTAMP', y="value", color="variable",
                 labels={"INSRT_TIMESTAMP": "Timestamp", "value": "AQI"},
-                title="Trend AQI  Over Time", markers=True)
+                title="Trend AQI  Over Time" + (f" ({trend_grain} mean)" if trend_grain else ""), markers=True)
 
     # Display the plot
     st.plotly_chart(fig_aqi, use_container_width=True)
 else:
     st.warning("No data available for the selected filters.")
 
+# Interpolated surface between stations from the latest sweep. Tiles are
+# computed once per poll cycle; reruns and map panning reuse them.
+map_readings, map_fetched_at = aqi_poller.latest()
+if map_readings is not None and not map_readings.empty:
+    st.subheader("AQI map")
+    map_metric = st.selectbox("Map metric", MAP_METRICS)
+    tiles = surface_tiles(map_fetched_at, map_metric, _readings=map_readings)
+    map_stations = station_frame(map_readings).dropna(subset=["lat", "lon"])
+    layers = [
+        pdk.Layer("BitmapLayer", image=tile.image, bounds=list(tile.bounds), opacity=0.7)
+        for tile in tiles
+    ]
+    layers.append(pdk.Layer(
+        "ScatterplotLayer", map_stations, get_position=["lon", "lat"],
+        get_radius=8000, get_fill_color=[30, 30, 30], pickable=True,
+    ))
+    st.pydeck_chart(pdk.Deck(
+        layers=layers,
+        initial_view_state=pdk.ViewState(latitude=22.5, longitude=82.5, zoom=3.5),
+        tooltip={"text": "{City}, {State}\nAQI: {AQI}"},
+    ))
+
 st.header("💡 Recommendations")
 st.image("./src/AQI.jpeg", caption="10 AI-specific ways to reduce air pollution in Delhi")
 st.markdown("""
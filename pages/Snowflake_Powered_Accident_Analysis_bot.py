@@ -1,7 +1,11 @@
 import streamlit as st
 import snowflake.snowpark as snowpark
-from snowflake.snowpark.session import Session
 import pandas as pd
+from utils.snowpark_sessions import get_session
+from utils.doc_index import get_doc_index
+from utils.embedding_cache import get_embedding_cache
+from utils.answer_cache import get_answer_cache, stage_fingerprint
+from utils.cortex_stream import stream_complete
 
 # Set pandas options
 pd.set_option("max_colwidth", None)
@@ -12,23 +16,11 @@ slide_window = 7
 
 
 
-# Establish a Snowflake session using Snowpark
+# Snowpark session for this user, kept alive across reruns by the shared
+# provider instead of logging in again on every chat message.
 def get_snowflake_session():
     try:
-        # Define your connection parameters
-        connection_parameters = {
-            "account": st.session_state.account,
-            "user": st.session_state.user,
-            "password": st.session_state.password,
-            "role": st.session_state.role,
-            "warehouse": st.session_state.warehouse,
-            "database": 'CC_QUICKSTART_CORTEX_DOCS',
-            "schema": 'DATA',
-        }
-
-        # Create a new session
-        session = Session.builder.configs(connection_parameters).create()
-        return session
+        return get_session(database='CC_QUICKSTART_CORTEX_DOCS', schema='DATA')
     except Exception as e:
         st.error(f"Error connecting to Snowflake: {str(e)}")
         return None
@@ -145,20 +137,19 @@ if session is not None:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
+    # Retrieval runs against an in-process copy of docs_chunks_table; only the
+    # question's embedding is computed in Snowflake, once per distinct question.
+    doc_index = get_doc_index(st.session_state.account, 'CC_QUICKSTART_CORTEX_DOCS', 'DATA')
+    doc_index.sync(session)
+    embedding_cache = get_embedding_cache()
+    # Answers to questions asked without chat history are reused for near-identical
+    # questions until a document in @docs changes.
+    answer_cache = get_answer_cache(st.session_state.account, 'CC_QUICKSTART_CORTEX_DOCS', 'DATA')
+    docs_fingerprint = stage_fingerprint(docs_available)
+    answer_cache.set_fingerprint(docs_fingerprint)
+
     def get_similar_chunks(question):
-        cmd = """
-            WITH results AS (
-                SELECT RELATIVE_PATH,
-                       VECTOR_COSINE_SIMILARITY(docs_chunks_table.chunk_vec,
-                        SNOWFLAKE.CORTEX.EMBED_TEXT_768('e5-base-v2', ?)) AS similarity,
-                       chunk
-                FROM docs_chunks_table
-                ORDER BY similarity DESC
-                LIMIT ?
-            )
-            SELECT chunk, relative_path FROM results
-        """
-        df_chunks = session.sql(cmd, params=[question, num_chunks]).to_pandas()
+        df_chunks = doc_index.search(embedding_cache.embed(session, question), num_chunks)
         similar_chunks = " ".join(df_chunks['CHUNK'].tolist())
         return similar_chunks.replace("'", "")
 
@@ -223,11 +214,9 @@ if session is not None:
         """
         return prompt
 
-    def complete(myquestion):
-        prompt = create_prompt(myquestion)
-        cmd = "SELECT snowflake.cortex.complete(?, ?) AS response"
-        df_response = session.sql(cmd, params=[st.session_state.model_name, prompt]).collect()
-        return df_response
+    def clean(chunks):
+        for chunk in chunks:
+            yield chunk.replace("'", "")
 
     # Accept user input for questions
     if question := st.chat_input("Chat with any docs"):
@@ -242,10 +231,24 @@ if session is not None:
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             question = question.replace("'", "")
-            with st.spinner(f"{st.session_state.model_name} thinking..."):
-                response = complete(question)
-                res_text = response[0].RESPONSE
-                res_text = res_text.replace("'", "")
+            # With chat history in play the answer depends on the conversation, not just the question.
+            cacheable = not (st.session_state.use_chat_history and get_chat_history())
+            res_text = None
+            if cacheable:
+                question_vec = embedding_cache.embed(session, question)
+                res_text = answer_cache.get(question_vec, st.session_state.model_name, docs_fingerprint)
+            if res_text is None:
+                with st.spinner(f"{st.session_state.model_name} thinking..."):
+                    prompt = create_prompt(question)
+                # Chunks as Cortex generates them, so the answer starts rendering right away.
+                stream = stream_complete(session, st.session_state.model_name, prompt)
+                res_text = message_placeholder.write_stream(clean(stream))
+                if not stream.complete:
+                    st.caption("The answer was cut off; ask again for the rest.")
+                # Only whole answers are reused.
+                elif cacheable and res_text.strip():
+                    answer_cache.put(question_vec, st.session_state.model_name, docs_fingerprint, res_text)
+            else:
                 message_placeholder.markdown(res_text)
 
         st.session_state.messages.append({"role": "assistant", "content": res_text})
@@ -0,0 +1,120 @@
+# Semantic cache of chatbot answers. A question whose embedding is close
+# enough to one already answered, by the same model over the same documents,
+# gets the earlier answer back without going to Cortex at all.
+import hashlib
+import threading
+import time
+
+import numpy as np
+import streamlit as st
+
+# Cosine similarity above which two questions count as the same question.
+SIMILARITY_THRESHOLD = 0.95
+# Lifetime of a cached answer, in seconds.
+ANSWER_TTL = 24 * 60 * 60
+# Answers kept per model; the oldest go first.
+MAX_ANSWERS = 2_000
+
+
+def stage_fingerprint(files):
+    """Fingerprint of a stage listing (``LS @stage`` rows): changes whenever a
+    file is added, removed or replaced."""
+    h = hashlib.sha256()
+    for row in sorted(files, key=lambda r: r["name"]):
+        h.update(f"{row['name']}|{row['size']}|{row['md5']}|{row['last_modified']}\n".encode())
+    return h.hexdigest()
+
+
+class _Bucket:
+    # Answers of one model over one document set, as parallel arrays.
+    def __init__(self, dim):
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.answers = []
+        self.expires_at = np.empty(0)
+
+
+class AnswerCache:
+    """Thread-safe (question embedding, model, context fingerprint) -> answer cache.
+
+    Answers are keyed on the fingerprint of the documents they were drawn
+    from; ``set_fingerprint`` drops everything cached for any other one, so a
+    change to the stage invalidates the whole cache at once.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, ttl=ANSWER_TTL, max_answers=MAX_ANSWERS):
+        self._threshold = threshold
+        self._ttl = ttl
+        self._max_answers = max_answers
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        # (model, fingerprint) -> _Bucket
+        self._buckets = {}
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "invalidations": 0}
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def set_fingerprint(self, fingerprint):
+        """Record the current context fingerprint, dropping answers cached under another."""
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                return
+            stale = [key for key in self._buckets if key[1] != fingerprint]
+            for key in stale:
+                del self._buckets[key]
+            if self._fingerprint is not None:
+                self.stats["invalidations"] += 1
+            self._fingerprint = fingerprint
+
+    def get(self, vector, model, fingerprint):
+        """The cached answer to the closest question within the threshold, or None."""
+        q = self._unit(vector)
+        with self._lock:
+            bucket = self._buckets.get((model, fingerprint))
+            if bucket is None or not len(bucket.answers):
+                self.stats["misses"] += 1
+                return None
+            scores = bucket.vectors @ q
+            live = bucket.expires_at > time.monotonic()
+            scores[~live] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] >= self._threshold:
+                self.stats["hits"] += 1
+                return bucket.answers[best]
+            if (~live).any():
+                self._drop(bucket, live)
+                self.stats["expired"] += int((~live).sum())
+            self.stats["misses"] += 1
+            return None
+
+    @staticmethod
+    def _drop(bucket, keep):
+        bucket.vectors = bucket.vectors[keep]
+        bucket.answers = [a for a, k in zip(bucket.answers, keep) if k]
+        bucket.expires_at = bucket.expires_at[keep]
+
+    def put(self, vector, model, fingerprint, answer):
+        q = self._unit(vector)
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                # Answered over documents that have since changed.
+                return
+            bucket = self._buckets.setdefault((model, fingerprint), _Bucket(len(q)))
+            bucket.vectors = np.vstack([bucket.vectors, q[None, :]])
+            bucket.answers.append(answer)
+            bucket.expires_at = np.append(bucket.expires_at, time.monotonic() + self._ttl)
+            if len(bucket.answers) > self._max_answers:
+                keep = np.arange(len(bucket.answers)) >= len(bucket.answers) - self._max_answers
+                self._drop(bucket, keep)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(bucket.answers) for bucket in self._buckets.values())
+
+
+@st.cache_resource(show_spinner=False)
+def get_answer_cache(account, database, schema):
+    return AnswerCache()
@@ -0,0 +1,236 @@
+# Streaming alerts over polled AQI readings. Each station keeps a fixed amount
+# of state per metric (last value, EWMA mean and variance), so a batch is
+# checked in one vectorized pass over the batch alone, never over history.
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+
+logger = logging.getLogger(__name__)
+
+ALERTS_PATH = Path(".snapshots/aqi_alerts.jsonl")
+# Past this size the alerts file is rotated to ``<name>.1``, replacing the
+# previous rotation, so at most about twice this is kept.
+MAX_ALERTS_BYTES = 8 * 2**20
+# Level crossings worth an alert: NAQI "Poor" and the matching PM bands.
+THRESHOLDS = {
+    "AQI": 200,
+    "PM2.5 (μg/m³)": 90,
+    "PM10 (μg/m³)": 250,
+}
+ANOMALY_METRICS = [
+    "AQI", "PM2.5 (μg/m³)", "PM10 (μg/m³)", "CO (μg/m³)",
+    "O3 (μg/m³)", "NO2 (μg/m³)", "SO2 (μg/m³)",
+]
+# EWMA weight of the newest reading; 0.2 is roughly the last ten readings.
+ALPHA = 0.2
+# A reading this many standard deviations off the EWMA is anomalous.
+Z_THRESHOLD = 3.0
+# Readings a station needs before its variance is trusted.
+WARMUP = 10
+# Variance floor, so a flat series doesn't turn tiny jitter into huge z-scores.
+MIN_STD = 1.0
+
+
+def _rotated(path):
+    return path.with_name(path.name + ".1")
+
+
+class JsonlFileSink:
+    """Appends alerts to a JSON-lines file, rotated once past ``max_bytes``."""
+
+    def __init__(self, path=ALERTS_PATH, max_bytes=MAX_ALERTS_BYTES):
+        self._path = Path(path)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def send(self, alerts):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            with open(self._path, "a", encoding="utf-8") as f:
+                for alert in alerts:
+                    f.write(json.dumps(alert, ensure_ascii=False, default=str) + "\n")
+                size = f.tell()
+            if size > self._max_bytes:
+                os.replace(self._path, _rotated(self._path))
+
+
+class WebhookSink:
+    """POSTs each batch of alerts as one JSON array."""
+
+    def __init__(self, url, timeout=5):
+        self._url = url
+        self._timeout = timeout
+        self._session = requests.Session()
+
+    def send(self, alerts):
+        response = self._session.post(self._url, json=alerts, timeout=self._timeout)
+        response.raise_for_status()
+
+
+class LogSink:
+    def send(self, alerts):
+        for alert in alerts:
+            logger.warning("AQI alert: %s", alert)
+
+
+def _tail(path, limit, block=64 * 1024):
+    # The last ``limit`` lines of ``path``, reading back from the end one
+    # block at a time rather than the whole file.
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return []
+    with f:
+        position = f.seek(0, os.SEEK_END)
+        data = b""
+        while position and data.count(b"\n") <= limit:
+            step = min(block, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    if position:
+        # The first line read is probably cut off.
+        lines = lines[1:]
+    return lines[-limit:] if limit else []
+
+
+def read_alerts(path=ALERTS_PATH, limit=50):
+    """The newest ``limit`` alerts written by a ``JsonlFileSink``, newest first."""
+    path = Path(path)
+    lines = _tail(path, limit)
+    if len(lines) < limit:
+        lines = _tail(_rotated(path), limit - len(lines)) + lines
+    if not lines:
+        return pd.DataFrame()
+    return pd.DataFrame([json.loads(line) for line in reversed(lines)])
+
+
+class AnomalyDetector:
+    """Flags threshold crossings and anomalous jumps per station.
+
+    ``process`` takes a poller frame, updates every station's state with
+    array arithmetic and sends whatever it flagged to each sink. Readings
+    with a ``Reading Time`` no newer than the station's last one are skipped,
+    so polling faster than weatherapi updates doesn't count a reading twice.
+    """
+
+    def __init__(self, sinks=(), thresholds=THRESHOLDS, metrics=ANOMALY_METRICS,
+                 alpha=ALPHA, z_threshold=Z_THRESHOLD, warmup=WARMUP):
+        self._sinks = list(sinks)
+        self._thresholds = dict(thresholds)
+        self._metrics = list(metrics)
+        self._alpha = alpha
+        self._z_threshold = z_threshold
+        self._warmup = warmup
+        self._lock = threading.Lock()
+        # One row per station: LAST_READING, then LAST/MEAN/VAR/N per metric.
+        self._state = pd.DataFrame(columns=self._state_columns(), dtype=float)
+        self._state.index.name = "Station ID"
+
+    def _state_columns(self):
+        columns = ["LAST_READING"]
+        for metric in self._metrics:
+            columns += [f"{metric}|LAST", f"{metric}|MEAN", f"{metric}|VAR", f"{metric}|N"]
+        return columns
+
+    def load(self, path):
+        try:
+            state = pd.read_parquet(path)
+        except (OSError, ValueError):
+            return self
+        with self._lock:
+            self._state = state.reindex(columns=self._state_columns())
+        return self
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        with self._lock:
+            self._state.to_parquet(tmp)
+        os.replace(tmp, path)
+
+    def process(self, df):
+        """Update state with one batch of readings and return the alerts raised."""
+        if df.empty:
+            return []
+        df = df.drop_duplicates("Station ID", keep="last").set_index("Station ID")
+        with self._lock:
+            new_stations = df.index.difference(self._state.index)
+            if len(new_stations):
+                added = pd.DataFrame(np.nan, index=new_stations, columns=self._state.columns)
+                self._state = pd.concat([self._state, added]) if len(self._state) else added
+                self._state.index.name = "Station ID"
+            state = self._state.loc[df.index]
+            if "Reading Time" not in df.columns:
+                fresh = np.ones(len(df), dtype=bool)
+            else:
+                reading = pd.to_numeric(df["Reading Time"], errors="coerce")
+                last_reading = state["LAST_READING"].to_numpy(dtype=float)
+                fresh = np.isnan(last_reading) | ~(reading.to_numpy(dtype=float) <= last_reading)
+                state.loc[fresh, "LAST_READING"] = reading[fresh]
+            alerts = []
+            for metric in self._metrics:
+                if metric not in df.columns:
+                    continue
+                x = pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype=float)
+                valid = fresh & ~np.isnan(x)
+                last = state[f"{metric}|LAST"].to_numpy(dtype=float)
+                mean = state[f"{metric}|MEAN"].to_numpy(dtype=float)
+                var = state[f"{metric}|VAR"].to_numpy(dtype=float)
+                n = np.nan_to_num(state[f"{metric}|N"].to_numpy(dtype=float))
+
+                threshold = self._thresholds.get(metric)
+                if threshold is not None:
+                    # Crossing upward only; a station that stays above doesn't re-alert.
+                    crossed = valid & (x >= threshold) & ~(last >= threshold)
+                    alerts += self._alerts(df, crossed, metric, "threshold", x, threshold=threshold)
+
+                std = np.sqrt(np.maximum(np.nan_to_num(var), MIN_STD ** 2))
+                z = (x - mean) / std
+                anomalous = valid & (n >= self._warmup) & (np.abs(z) >= self._z_threshold)
+                alerts += self._alerts(df, anomalous, metric, "anomaly", x, z=z, mean=mean)
+
+                # Exponentially weighted mean and variance; the first reading seeds the mean.
+                diff = x - np.where(np.isnan(mean), x, mean)
+                new_mean = np.where(np.isnan(mean), x, mean + self._alpha * diff)
+                new_var = (1 - self._alpha) * (np.nan_to_num(var) + self._alpha * diff ** 2)
+                state[f"{metric}|LAST"] = np.where(valid, x, last)
+                state[f"{metric}|MEAN"] = np.where(valid, new_mean, mean)
+                state[f"{metric}|VAR"] = np.where(valid, new_var, var)
+                state[f"{metric}|N"] = n + valid
+            self._state.loc[df.index] = state
+        if alerts:
+            for sink in self._sinks:
+                try:
+                    sink.send(alerts)
+                except Exception:
+                    logger.exception("AQI alert sink %s failed", type(sink).__name__)
+        return alerts
+
+    @staticmethod
+    def _alerts(df, mask, metric, kind, x, threshold=None, z=None, mean=None):
+        if not mask.any():
+            return []
+        rows = df[mask]
+        out = []
+        for i, (station_id, row) in zip(np.flatnonzero(mask), rows.iterrows()):
+            alert = {
+                "station_id": station_id, "state": row.get("State"), "city": row.get("City"),
+                "metric": metric, "kind": kind, "value": float(x[i]),
+                "reading_time": None if pd.isna(row.get("Reading Time")) else int(row["Reading Time"]),
+            }
+            if threshold is not None:
+                alert["threshold"] = threshold
+            if z is not None:
+                alert["z"] = round(float(z[i]), 2)
+                alert["mean"] = round(float(mean[i]), 2)
+            out.append(alert)
+        return out
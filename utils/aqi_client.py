@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = "http://api.weatherapi.com/v1/current.json"
+# Parallel requests in flight during a sweep.
+MAX_CONCURRENCY = 16
+# Sustained request rate and burst allowed by the weatherapi plan.
+RATE_PER_SECOND = 10
+BURST = 20
+# (connect, read) timeout for a single request, in seconds.
+TIMEOUT = (3.05, 10)
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, up to ``capacity``."""
+
+    def __init__(self, rate=RATE_PER_SECOND, capacity=BURST):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class FetchResult(NamedTuple):
+    city: str
+    data: Optional[dict]
+    error: Optional[str] = None
+    attempts: int = 1
+
+
+class SweepResult(NamedTuple):
+    results: dict
+    elapsed: float
+
+    @property
+    def succeeded(self):
+        return {city: r.data for city, r in self.results.items() if r.data is not None}
+
+    @property
+    def failed(self):
+        return {city: r.error for city, r in self.results.items() if r.data is None}
+
+    @property
+    def partial(self):
+        return bool(self.failed)
+
+
+def _backoff(attempt):
+    # "Full jitter": a random wait up to an exponentially growing ceiling.
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class AQIClient:
+    """weatherapi.com client with a pooled session, bounded concurrency,
+    a shared rate limiter, per-request timeouts and jittered retries."""
+
+    def __init__(self, api_key, max_concurrency=MAX_CONCURRENCY, rate_limiter=None,
+                 timeout=TIMEOUT, max_retries=MAX_RETRIES):
+        self._api_key = api_key
+        self._max_concurrency = max_concurrency
+        self._rate_limiter = rate_limiter or TokenBucket()
+        self._timeout = timeout
+        self._max_retries = max_retries
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def fetch(self, city):
+        error = None
+        for attempt in range(self._max_retries + 1):
+            if attempt:
+                time.sleep(_backoff(attempt))
+            self._rate_limiter.acquire()
+            try:
+                response = self._session.get(
+                    API_URL, params={"key": self._api_key, "q": city, "aqi": "yes"}, timeout=self._timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                error = f"{type(e).__name__}: {e}"
+                continue
+            except requests.RequestException as e:
+                # Anything else (a bad URL, too many redirects) fails the same way again.
+                error = f"{type(e).__name__}: {e}"
+                break
+            if response.status_code == 200:
+                try:
+                    return FetchResult(city, response.json(), attempts=attempt + 1)
+                except ValueError as e:
+                    # A 200 whose body isn't JSON, e.g. a proxy's error page.
+                    error = f"Invalid JSON response: {e}"
+                    continue
+            error = f"HTTP {response.status_code}"
+            if response.status_code not in RETRY_STATUSES:
+                break
+        return FetchResult(city, None, error, attempts=attempt + 1)
+
+    def sweep(self, cities):
+        """Fetch every city concurrently. Failures are reported per city, never raised."""
+        started = time.monotonic()
+        cities = list(dict.fromkeys(cities))
+        with ThreadPoolExecutor(max_workers=max(1, min(self._max_concurrency, len(cities)))) as pool:
+            results = dict(zip(cities, pool.map(self.fetch, cities)))
+        return SweepResult(results, time.monotonic() - started)
+
+    def close(self):
+        self._session.close()
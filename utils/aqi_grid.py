@@ -0,0 +1,163 @@
+# Continuous AQI surface over India from the station readings: inverse-distance
+# weighting over each grid cell's nearest stations, rendered to PNG tiles that
+# a pydeck map can place without recomputing anything on pan or zoom.
+import base64
+import io
+from typing import NamedTuple
+
+import numpy as np
+import streamlit as st
+from PIL import Image
+
+from utils.aqi_index import NAQI_BOUNDS, NAQI_BREAKPOINTS, POLLER_COLUMNS
+from utils.aqi_stations import load_stations
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # Falls back to a brute-force neighbour search.
+    cKDTree = None
+
+# (south, west, north, east) in degrees.
+INDIA_BOUNDS = (6.5, 68.0, 37.5, 97.5)
+# Grid cell size in degrees.
+RESOLUTION = 0.1
+# Tiles are TILE_DEGREES on a side, so a map only redraws what changed.
+TILE_DEGREES = 5.0
+NEIGHBOURS = 8
+POWER = 2.0
+# Cells farther than this from every station are left transparent.
+MAX_DISTANCE_KM = 400.0
+# NAQI band colours, Good -> Severe.
+BAND_COLOURS = np.array([
+    [0, 176, 80], [146, 208, 80], [255, 255, 0],
+    [255, 153, 0], [255, 0, 0], [192, 0, 0],
+], dtype=np.uint8)
+ALPHA = 150
+# Poller columns the map can interpolate.
+MAP_METRICS = ["AQI", "PM2.5 (μg/m³)", "PM10 (μg/m³)", "NO2 (μg/m³)", "O3 (μg/m³)", "SO2 (μg/m³)", "CO (μg/m³)"]
+
+_KM_PER_DEGREE = 111.2
+
+
+class Tile(NamedTuple):
+    # Data URI of the PNG and its [west, south, east, north] bounds.
+    image: str
+    bounds: tuple
+
+
+def _project(lat, lon):
+    # Equirectangular projection to km around India's middle latitude: good
+    # enough for nearest-neighbour distances at this scale, and Euclidean.
+    lat0 = np.radians((INDIA_BOUNDS[0] + INDIA_BOUNDS[2]) / 2)
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    return np.column_stack([lon * np.cos(lat0) * _KM_PER_DEGREE, lat * _KM_PER_DEGREE])
+
+
+def _neighbours(points, queries, k):
+    k = min(k, len(points))
+    if cKDTree is not None:
+        distances, indices = cKDTree(points).query(queries, k=k)
+        return distances.reshape(len(queries), k), indices.reshape(len(queries), k)
+    # Few stations: one distance matrix per chunk of cells is cheap enough.
+    distances = np.empty((len(queries), k))
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), 65536):
+        chunk = queries[start:start + 65536]
+        d = np.sqrt(((chunk[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+        nearest = np.argpartition(d, k - 1, axis=1)[:, :k]
+        distances[start:start + len(chunk)] = np.take_along_axis(d, nearest, axis=1)
+        indices[start:start + len(chunk)] = nearest
+    return distances, indices
+
+
+def idw(lat, lon, values, grid_lat, grid_lon, k=NEIGHBOURS, power=POWER, max_distance=MAX_DISTANCE_KM):
+    """Inverse-distance-weighted values at every (grid_lat, grid_lon) point.
+
+    Each point uses its ``k`` nearest stations; points on a station take its
+    value, and points with no station within ``max_distance`` km are NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values) & ~np.isnan(np.asarray(lat, dtype=float)) & ~np.isnan(np.asarray(lon, dtype=float))
+    grid_shape = np.shape(grid_lat)
+    if not valid.any():
+        return np.full(grid_shape, np.nan)
+    points = _project(np.asarray(lat)[valid], np.asarray(lon)[valid])
+    queries = _project(np.ravel(grid_lat), np.ravel(grid_lon))
+    distances, indices = _neighbours(points, queries, k)
+    with np.errstate(divide="ignore"):
+        weights = 1.0 / distances ** power
+    exact = np.isinf(weights)
+    # A cell sitting on a station takes that station's value.
+    weights = np.where(exact.any(axis=1, keepdims=True), exact.astype(float), weights)
+    surface = (weights * values[valid][indices]).sum(axis=1) / weights.sum(axis=1)
+    surface[distances[:, 0] > max_distance] = np.nan
+    return surface.reshape(grid_shape)
+
+
+def _band_bounds(column):
+    if column == "AQI":
+        return NAQI_BOUNDS
+    pollutant = {name: p for p, name in POLLER_COLUMNS.items()}[column]
+    conc, _, scale = NAQI_BREAKPOINTS[pollutant]
+    # NAQI concentration breakpoints, back in the μg/m³ the poller reports.
+    return np.asarray(conc[1:-1], dtype=float) / scale
+
+
+def _colourize(surface, bounds):
+    rgba = np.zeros(surface.shape + (4,), dtype=np.uint8)
+    known = ~np.isnan(surface)
+    rgba[known, :3] = BAND_COLOURS[np.searchsorted(bounds, surface[known], side="left")]
+    rgba[known, 3] = ALPHA
+    return rgba
+
+
+def _png(rgba):
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, "RGBA").save(buffer, format="PNG", optimize=True)
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def render_tiles(surface, grid_lat, grid_lon, resolution, bounds):
+    """Cut a colourized surface into ``TILE_DEGREES`` tiles, skipping empty ones."""
+    rgba = _colourize(surface, bounds)
+    cells = max(1, int(round(TILE_DEGREES / resolution)))
+    tiles = []
+    for row in range(0, surface.shape[0], cells):
+        for col in range(0, surface.shape[1], cells):
+            block = rgba[row:row + cells, col:col + cells]
+            if not block[..., 3].any():
+                continue
+            south, west = grid_lat[row, 0] - resolution / 2, grid_lon[0, col] - resolution / 2
+            north = grid_lat[min(row + cells, surface.shape[0]) - 1, 0] + resolution / 2
+            east = grid_lon[0, min(col + cells, surface.shape[1]) - 1] + resolution / 2
+            # Image rows run north to south.
+            tiles.append(Tile(_png(block[::-1]), (west, south, east, north)))
+    return tiles
+
+
+def station_frame(readings):
+    """Poller readings joined with the registry's coordinates."""
+    coordinates = {s.station_id: (s.lat, s.lon) for s in load_stations()}
+    frame = readings.copy()
+    frame["lat"] = [coordinates.get(station, (np.nan, np.nan))[0] for station in frame["Station ID"]]
+    frame["lon"] = [coordinates.get(station, (np.nan, np.nan))[1] for station in frame["Station ID"]]
+    return frame
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def surface_tiles(fetched_at, column="AQI", resolution=RESOLUTION, _readings=None):
+    """PNG tiles of the interpolated ``column`` surface for one poll cycle.
+
+    Cached on ``fetched_at``: every rerun and every map interaction within a
+    cycle reuses the same tiles, and a new sweep computes them once.
+    """
+    stations = station_frame(_readings)
+    south, west, north, east = INDIA_BOUNDS
+    grid_lat, grid_lon = np.meshgrid(
+        np.arange(south + resolution / 2, north, resolution),
+        np.arange(west + resolution / 2, east, resolution),
+        indexing="ij",
+    )
+    surface = idw(stations["lat"], stations["lon"], stations[column], grid_lat, grid_lon)
+    return render_tiles(surface, grid_lat, grid_lon, resolution, _band_bounds(column))
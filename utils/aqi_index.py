@@ -0,0 +1,145 @@
+# Vectorized air-quality indices over whole columns of readings. Each index is
+# a piecewise-linear map from concentration breakpoints to index breakpoints:
+# searchsorted finds every value's segment and the ends are interpolated with
+# array arithmetic. Inputs are μg/m³ as reported by weatherapi.
+import numpy as np
+import pandas as pd
+
+POLLUTANTS = ("PM25", "PM10", "CO", "O3", "NO2", "SO2")
+
+# Pollutant -> column name, for frames shaped like T01_AQI_FOR_INDIAN_STATES.
+TABLE_COLUMNS = {p: p for p in POLLUTANTS}
+# Pollutant -> column name, for frames produced by the AQI poller.
+POLLER_COLUMNS = {
+    "PM25": "PM2.5 (μg/m³)",
+    "PM10": "PM10 (μg/m³)",
+    "CO": "CO (μg/m³)",
+    "O3": "O3 (μg/m³)",
+    "NO2": "NO2 (μg/m³)",
+    "SO2": "SO2 (μg/m³)",
+}
+
+# Molecular weights for μg/m³ -> ppb at 25 °C and 1 atm (ppb = μg/m³ * 24.45 / MW).
+_MOLECULAR_WEIGHT = {"CO": 28.01, "O3": 48.00, "NO2": 46.01, "SO2": 64.07}
+
+# UK DEFRA daily index for PM2.5: upper bound (inclusive) of bands 1-9; above is band 10.
+DEFRA_PM25_BOUNDS = np.array([11, 23, 35, 41, 47, 53, 58, 64, 70], dtype=float)
+DEFRA_LABELS = np.array([
+    "Low (1)", "Low (2)", "Low (3)",
+    "Moderate (4)", "Moderate (5)", "Moderate (6)",
+    "High (7)", "High (8)", "High (9)",
+    "Very High (10)",
+], dtype=object)
+
+# (concentration breakpoints, index breakpoints, unit scale applied to μg/m³).
+# Values past the last breakpoint are clipped to the top of the scale.
+NAQI_BREAKPOINTS = {
+    # CPCB National Air Quality Index. CO is in mg/m³, everything else in μg/m³.
+    "PM25": ([0, 30, 60, 90, 120, 250, 380], [0, 50, 100, 200, 300, 400, 500], 1.0),
+    "PM10": ([0, 50, 100, 250, 350, 430, 510], [0, 50, 100, 200, 300, 400, 500], 1.0),
+    "CO": ([0, 1.0, 2.0, 10, 17, 34, 50], [0, 50, 100, 200, 300, 400, 500], 1e-3),
+    "O3": ([0, 50, 100, 168, 208, 748, 1000], [0, 50, 100, 200, 300, 400, 500], 1.0),
+    "NO2": ([0, 40, 80, 180, 280, 400, 520], [0, 50, 100, 200, 300, 400, 500], 1.0),
+    "SO2": ([0, 40, 80, 380, 800, 1600, 2100], [0, 50, 100, 200, 300, 400, 500], 1.0),
+}
+NAQI_BOUNDS = np.array([50, 100, 200, 300, 400], dtype=float)
+NAQI_LABELS = np.array(["Good", "Satisfactory", "Moderate", "Poor", "Very Poor", "Severe"], dtype=object)
+
+
+def _ppb(pollutant):
+    return 24.45 / _MOLECULAR_WEIGHT[pollutant]
+
+
+US_EPA_BREAKPOINTS = {
+    # US EPA AQI. PM in μg/m³, CO and O3 (8-hour) in ppm, NO2 and SO2 in ppb.
+    "PM25": ([0, 12.0, 35.4, 55.4, 150.4, 250.4, 350.4, 500.4], [0, 50, 100, 150, 200, 300, 400, 500], 1.0),
+    "PM10": ([0, 54, 154, 254, 354, 424, 504, 604], [0, 50, 100, 150, 200, 300, 400, 500], 1.0),
+    "CO": ([0, 4.4, 9.4, 12.4, 15.4, 30.4, 40.4, 50.4], [0, 50, 100, 150, 200, 300, 400, 500], _ppb("CO") * 1e-3),
+    "O3": ([0, 0.054, 0.070, 0.085, 0.105, 0.200], [0, 50, 100, 150, 200, 300], _ppb("O3") * 1e-3),
+    "NO2": ([0, 53, 100, 360, 649, 1249, 1649, 2049], [0, 50, 100, 150, 200, 300, 400, 500], _ppb("NO2")),
+    "SO2": ([0, 35, 75, 185, 304, 604, 804, 1004], [0, 50, 100, 150, 200, 300, 400, 500], _ppb("SO2")),
+}
+US_EPA_BOUNDS = np.array([50, 100, 150, 200, 300], dtype=float)
+US_EPA_LABELS = np.array([
+    "Good", "Moderate", "Unhealthy for sensitive group",
+    "Unhealthy", "Very Unhealthy", "Hazardous",
+], dtype=object)
+
+STANDARDS = {
+    "naqi": (NAQI_BREAKPOINTS, NAQI_BOUNDS, NAQI_LABELS),
+    "us_epa": (US_EPA_BREAKPOINTS, US_EPA_BOUNDS, US_EPA_LABELS),
+}
+
+
+def _as_float(values):
+    return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+
+
+def _label(bands, labels):
+    # bands is a float array (NaN for missing input); missing values get "N/A".
+    out = np.full(bands.shape, "N/A", dtype=object)
+    valid = ~np.isnan(bands)
+    out[valid] = labels[bands[valid].astype(int)]
+    return out
+
+
+def defra_pm25_band(pm25):
+    """DEFRA band (1-10) for each PM2.5 value; NaN where the value is missing."""
+    values = _as_float(pm25)
+    bands = np.searchsorted(DEFRA_PM25_BOUNDS, values, side="left").astype(float) + 1
+    bands[np.isnan(values)] = np.nan
+    return bands
+
+
+def defra_pm25_category(pm25):
+    """DEFRA labels ("Low (1)" ... "Very High (10)") for each PM2.5 value."""
+    return _label(defra_pm25_band(pm25) - 1, DEFRA_LABELS)
+
+
+def sub_index(values, pollutant, standard="naqi"):
+    """Sub-index of ``pollutant`` for an array of μg/m³ concentrations."""
+    conc_bp, index_bp, scale = STANDARDS[standard][0][pollutant]
+    conc_bp = np.asarray(conc_bp, dtype=float)
+    index_bp = np.asarray(index_bp, dtype=float)
+    conc = np.clip(_as_float(values) * scale, 0, conc_bp[-1])
+    segment = np.clip(np.searchsorted(conc_bp, conc, side="left"), 1, len(conc_bp) - 1)
+    c_lo, c_hi = conc_bp[segment - 1], conc_bp[segment]
+    i_lo, i_hi = index_bp[segment - 1], index_bp[segment]
+    return i_lo + (i_hi - i_lo) * (conc - c_lo) / (c_hi - c_lo)
+
+
+def categorize(index, standard="naqi"):
+    """Category label for each overall index value."""
+    values = _as_float(index)
+    _, bounds, labels = STANDARDS[standard]
+    bands = np.searchsorted(bounds, np.round(values), side="left").astype(float)
+    bands[np.isnan(values)] = np.nan
+    return _label(bands, labels)
+
+
+def compute_indices(df, standard="naqi", columns=TABLE_COLUMNS, min_pollutants=1):
+    """Sub-indices, overall index, category and dominant pollutant for every row.
+
+    ``columns`` maps pollutant names to the frame's column names; pollutants
+    without a column are skipped. Rows with fewer than ``min_pollutants``
+    sub-indices (CPCB asks for 3) get no overall index.
+    """
+    present = [p for p in POLLUTANTS if columns.get(p) in df.columns]
+    subs = pd.DataFrame(
+        {f"{p}_SUBINDEX": sub_index(df[columns[p]], p, standard) for p in present},
+        index=df.index,
+    )
+    matrix = subs.to_numpy(dtype=float)
+    if not present:
+        matrix = np.full((len(df), 1), np.nan)
+    counted = (~np.isnan(matrix)).sum(axis=1)
+    filled = np.where(np.isnan(matrix), -np.inf, matrix)
+    overall = filled.max(axis=1)
+    overall[(counted < min_pollutants) | np.isinf(overall)] = np.nan
+    dominant = np.array(present or [None], dtype=object)[filled.argmax(axis=1)]
+    dominant[np.isnan(overall)] = None
+
+    subs["AQI"] = np.round(overall)
+    subs["AIR_QUALITY"] = categorize(overall, standard)
+    subs["DOMINANT_POLLUTANT"] = dominant
+    return subs
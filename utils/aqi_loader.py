@@ -0,0 +1,87 @@
+import pandas as pd
+from snowflake.connector.pandas_tools import write_pandas
+
+AQI_TABLE = "T01_AQI_FOR_INDIAN_STATES"
+# Poller frame column -> T01_AQI_FOR_INDIAN_STATES column.
+READING_COLUMNS = {
+    "State": "STATE",
+    "City": "CITY",
+    "PM2.5 (μg/m³)": "PM25",
+    "PM2.5 Category (DEFRA)": "PM25_CATEGORY",
+    "PM10 (μg/m³)": "PM10",
+    "CO (μg/m³)": "CO",
+    "O3 (μg/m³)": "O3",
+    "NO2 (μg/m³)": "NO2",
+    "SO2 (μg/m³)": "SO2",
+    "US-EPA Index": "US_EPA_INDEX",
+    "Reading Time": "READING_TIME",
+}
+# At or above this many rows, readings are staged as Parquet and loaded with
+# COPY INTO (write_pandas); below it, a batched multi-row INSERT is cheaper.
+BULK_THRESHOLD = 5000
+INSERT_BATCH_SIZE = 1000
+
+
+def reading_timestamps(reading_times):
+    """weatherapi epoch reading times as naive IST, like INSRT_TIMESTAMP.
+
+    Readings without one are stamped with the current time, as the column
+    default would have.
+    """
+    stamps = pd.to_datetime(pd.to_numeric(reading_times, errors="coerce"), unit="s", utc=True)
+    stamps = stamps.fillna(pd.Timestamp.now(tz="UTC"))
+    return stamps.dt.tz_convert("Asia/Kolkata").dt.tz_localize(None)
+
+
+def to_table_frame(dataframe, batch_id):
+    # reindex: readings spooled before a column existed load it as NULL.
+    frame = dataframe.reindex(columns=list(READING_COLUMNS)).rename(columns=READING_COLUMNS)
+    # Stamp rows with when they were observed, not when they were loaded, so
+    # sweeps flushed together after an outage keep their own place in time.
+    frame["INSRT_TIMESTAMP"] = reading_timestamps(frame["READING_TIME"])
+    frame["BATCH_ID"] = batch_id
+    return frame.reset_index(drop=True)
+
+
+def _rows(frame):
+    # NaN would be sent as the string 'nan'; Snowflake wants NULL.
+    return list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+
+
+def load_readings(conn, dataframe, batch_id):
+    """Write one sweep of readings to T01_AQI_FOR_INDIAN_STATES in bulk.
+
+    Loading is idempotent per ``batch_id``: rows from an earlier attempt at
+    the same batch are removed first, so a retried batch never duplicates.
+    Returns the number of rows written.
+    """
+    frame = to_table_frame(dataframe, batch_id)
+    cursor = conn.cursor()
+    try:
+        if len(frame) >= BULK_THRESHOLD:
+            # COPY INTO is a single atomic statement; write_pandas creates a
+            # temporary stage first, which would implicitly commit an open
+            # transaction, so the delete runs on its own.
+            cursor.execute(f"DELETE FROM {AQI_TABLE} WHERE BATCH_ID = %s", (batch_id,))
+            success, _, nrows, _ = write_pandas(conn, frame, AQI_TABLE, use_logical_type=True)
+            if not success:
+                raise RuntimeError(f"COPY INTO {AQI_TABLE} failed for batch {batch_id}")
+            return nrows
+
+        columns = ", ".join(frame.columns)
+        placeholders = ", ".join(["%s"] * len(frame.columns))
+        insert_query = f"INSERT INTO {AQI_TABLE} ({columns}) VALUES ({placeholders})"
+        rows = _rows(frame)
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute(f"DELETE FROM {AQI_TABLE} WHERE BATCH_ID = %s", (batch_id,))
+            for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                # The connector folds each executemany() into one multi-row INSERT.
+                cursor.executemany(insert_query, rows[start:start + INSERT_BATCH_SIZE])
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        return len(rows)
+    finally:
+        cursor.close()
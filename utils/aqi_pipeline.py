@@ -0,0 +1,237 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from utils.aqi_loader import AQI_TABLE, load_readings, reading_timestamps
+from utils.aqi_retention import RETENTION_INTERVAL, SERVING_SNAPSHOT, RetentionPolicy, apply_retention
+from utils.aqi_spool import Spool
+from utils.query_cache import invalidate_tables
+from utils.snapshot_store import rewind
+from utils.snowflake_pool import get_pool, session_params_from_state
+
+logger = logging.getLogger(__name__)
+
+SERVING_TABLE = "IND_DB.IND_SCH.T01_DYNAMIC_AQI_FOR_INDIAN_STATES"
+# Seconds between two status checks of a running refresh.
+STATUS_POLL_INTERVAL = 2
+# How long a refresh may run before the pipeline stops waiting on it.
+REFRESH_TIMEOUT = 15 * 60
+# Seconds between two background flushes of the spool.
+FLUSH_INTERVAL = 60
+
+CREATE_TABLE_QUERY = f"""
+CREATE TABLE IF NOT EXISTS {AQI_TABLE} (
+    State VARCHAR,
+    City VARCHAR,
+    PM25 FLOAT,
+    PM25_Category VARCHAR,
+    PM10 FLOAT,
+    CO FLOAT,
+    O3 FLOAT,
+    NO2 FLOAT,
+    SO2 FLOAT,
+    US_EPA_Index FLOAT,
+    READING_TIME NUMBER,
+    INSRT_TIMESTAMP TIMESTAMP_NTZ DEFAULT CONVERT_TIMEZONE('Asia/Kolkata', CURRENT_TIMESTAMP),
+    BATCH_ID VARCHAR
+)
+"""
+# Tables created before bulk loading / spooling lack these columns.
+ADD_COLUMN_QUERIES = [
+    f"ALTER TABLE {AQI_TABLE} ADD COLUMN IF NOT EXISTS BATCH_ID VARCHAR",
+    f"ALTER TABLE {AQI_TABLE} ADD COLUMN IF NOT EXISTS READING_TIME NUMBER",
+]
+# The dynamic table refreshes incrementally: only rows landed since its last
+# refresh are merged, not a full recompute.
+REFRESH_QUERY = "ALTER DYNAMIC TABLE IDENTIFIER(%s) REFRESH"
+
+
+class PipelineRun:
+    """Progress of one flush through queued -> loading -> refreshing -> done/failed."""
+
+    def __init__(self):
+        self.stage = "queued"
+        self.rows = 0
+        self.batches = 0
+        self.query_id = None
+        self.query_status = None
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.stage not in ("done", "failed")
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class AQIPipeline:
+    """Drains the local AQI spool to Snowflake and refreshes the serving table.
+
+    Pollers only ever write to the spool, so readings are kept while the
+    warehouse is down. A single worker thread flushes it every
+    ``FLUSH_INTERVAL`` seconds (or on ``flush()``): it bulk-loads the spooled
+    readings batch by batch, starts the dynamic-table refresh as an
+    asynchronous query and follows it until it completes, so a click never
+    waits on the warehouse. A batch that fails stays in the spool and is
+    retried under the same id on the next flush. The schema is checked once
+    per process. Retention runs on the same worker at most once per
+    ``RETENTION_INTERVAL``, so compaction never overlaps a load.
+    """
+
+    def __init__(self, pool, retention=RetentionPolicy(), spool=None, flush_interval=FLUSH_INTERVAL):
+        self._pool = pool
+        self._retention = retention
+        self._spool = spool or Spool()
+        self._flush_interval = flush_interval
+        self._last_retention = None
+        self._retention_error = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aqi-pipeline")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._timer = None
+        self._last = None
+        self._schema_ready = set()
+        # Earliest reading loaded but not yet seen through a completed refresh.
+        self._unrefreshed = None
+
+    def _ensure_schema(self, cursor, session_params):
+        key = tuple(sorted(session_params.items()))
+        if key in self._schema_ready:
+            return
+        cursor.execute(CREATE_TABLE_QUERY)
+        for query in ADD_COLUMN_QUERIES:
+            cursor.execute(query)
+        self._schema_ready.add(key)
+
+    def start(self, session_params):
+        """Flush in the background every ``flush_interval`` seconds."""
+        if self._timer is None:
+            self._timer = threading.Thread(
+                target=self._flush_periodically, args=(session_params,), name="aqi-flusher", daemon=True,
+            )
+            self._timer.start()
+        return self
+
+    def _flush_periodically(self, session_params):
+        while not self._stop.wait(self._flush_interval):
+            if self._spool.pending():
+                self.flush(session_params)
+
+    def pending(self):
+        """Readings spooled but not yet in Snowflake."""
+        return self._spool.pending()
+
+    def flush(self, session_params=None):
+        """Queue a flush of the spool; returns its ``PipelineRun``.
+
+        While a flush is queued or running, that run is returned instead.
+        """
+        if session_params is None:
+            session_params = session_params_from_state()
+        with self._lock:
+            if self._last is not None and self._last.active:
+                return self._last
+            run = self._last = PipelineRun()
+        ctx = get_script_run_ctx()
+        self._executor.submit(self._run, run, session_params, ctx)
+        return run
+
+    def _run(self, run, session_params, ctx):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        try:
+            with self._pool.connection(session_params) as conn:
+                cursor = conn.cursor()
+                try:
+                    run.stage = "loading"
+                    self._ensure_schema(cursor, session_params)
+                    while True:
+                        batch_id, dataframe = self._spool.claim()
+                        if batch_id is None:
+                            break
+                        run.rows += load_readings(conn, dataframe, batch_id)
+                        self._spool.mark_flushed(batch_id)
+                        invalidate_tables(AQI_TABLE)
+                        run.batches += 1
+                        earliest = reading_timestamps(dataframe.get("Reading Time", pd.Series(dtype=float))).min()
+                        if pd.notna(earliest) and (self._unrefreshed is None or earliest < self._unrefreshed):
+                            self._unrefreshed = earliest
+                    # Also retries a refresh that failed after an earlier load.
+                    if self._unrefreshed is not None:
+                        run.stage = "refreshing"
+                        cursor.execute_async(REFRESH_QUERY, (SERVING_TABLE,))
+                        run.query_id = cursor.sfqid
+                        self._wait(conn, run)
+                finally:
+                    cursor.close()
+            if self._unrefreshed is not None:
+                # Backlogged readings are older than what the local snapshot
+                # has already synced; make its next sync go back for them.
+                rewind(SERVING_SNAPSHOT, self._unrefreshed)
+                self._unrefreshed = None
+                invalidate_tables(SERVING_TABLE)
+            run.finished_at = time.time()
+            run.stage = "done"
+        except Exception as e:
+            logger.exception("AQI spool flush failed")
+            run.error = str(e)
+            run.finished_at = time.time()
+            run.stage = "failed"
+            return
+        self._spool.purge()
+        self._maybe_apply_retention(session_params)
+
+    def _maybe_apply_retention(self, session_params):
+        last = self._last_retention.ran_at if self._last_retention else 0
+        if time.time() - last < RETENTION_INTERVAL:
+            return
+        try:
+            with self._pool.connection(session_params) as conn:
+                report = apply_retention(conn, self._retention)
+            self._last_retention, self._retention_error = report, None
+            if report.raw_rows_compacted or report.hourly_rows_compacted:
+                invalidate_tables(AQI_TABLE, SERVING_TABLE)
+            logger.info("AQI retention: %s", report)
+        except Exception as e:
+            logger.exception("AQI retention failed")
+            self._retention_error = str(e)
+
+    def _wait(self, conn, run):
+        deadline = time.monotonic() + REFRESH_TIMEOUT
+        while True:
+            # Raises if the refresh failed.
+            status = conn.get_query_status_throw_if_error(run.query_id)
+            run.query_status = status.name
+            if not conn.is_still_running(status):
+                return
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Refresh of {SERVING_TABLE} still {status.name} after {REFRESH_TIMEOUT}s")
+            time.sleep(STATUS_POLL_INTERVAL)
+
+    def last_run(self):
+        with self._lock:
+            return self._last
+
+    def last_retention(self):
+        """``(RetentionReport or None, error or None)`` for the latest retention pass."""
+        return self._last_retention, self._retention_error
+
+    def close(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+        self._spool.close()
+
+
+@st.cache_resource(show_spinner=False)
+def get_aqi_pipeline(account, user, password, retention=RetentionPolicy()):
+    # The background flusher uses the session context of the first page that asked.
+    return AQIPipeline(get_pool(account, user, password), retention).start(session_params_from_state())
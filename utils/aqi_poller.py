@@ -0,0 +1,314 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from utils.aqi_alerts import AnomalyDetector, JsonlFileSink, WebhookSink
+from utils.aqi_client import BURST, RATE_PER_SECOND, AQIClient, TokenBucket
+from utils.aqi_index import POLLER_COLUMNS, compute_indices, defra_pm25_category
+from utils.aqi_spool import Spool
+from utils.aqi_stations import due, load_stations, shard
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process polls on its own.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two sweeps over every city.
+POLL_INTERVAL = 10 * 60
+SNAPSHOT_DIR = Path(".snapshots")
+# One Parquet file (plus a .json with fetch time and failures) per shard.
+LATEST_DIR = SNAPSHOT_DIR / "aqi_latest"
+
+NUMERIC_COLUMNS = [
+    "PM2.5 (μg/m³)", "PM10 (μg/m³)", "CO (μg/m³)", "O3 (μg/m³)",
+    "NO2 (μg/m³)", "SO2 (μg/m³)", "US-EPA Index",
+]
+
+
+def fetch_readings(client, stations):
+    """One concurrent sweep over ``stations``.
+
+    Returns a frame with one row per station that reported PM2.5, and the
+    ``{city: error}`` map of stations that could not be fetched.
+    """
+    sweep = client.sweep(station.query for station in stations)
+    responses = sweep.succeeded
+    state_aqi_data = []
+    for station in stations:
+        aqi_response = responses.get(station.query)
+        if aqi_response and "current" in aqi_response and "air_quality" in aqi_response["current"]:
+            air_quality = aqi_response["current"]["air_quality"]
+            state_aqi_data.append({
+                "Station ID": station.station_id, "State": station.state, "City": station.city,
+                "PM2.5 (μg/m³)": air_quality.get("pm2_5", "N/A"),
+                "PM10 (μg/m³)": air_quality.get("pm10", "N/A"),
+                "CO (μg/m³)": air_quality.get("co", "N/A"),
+                "O3 (μg/m³)": air_quality.get("o3", "N/A"),
+                "NO2 (μg/m³)": air_quality.get("no2", "N/A"),
+                "SO2 (μg/m³)": air_quality.get("so2", "N/A"),
+                "US-EPA Index": air_quality.get("us-epa-index", "N/A"),
+                # When weatherapi last updated the observation (epoch seconds).
+                "Reading Time": aqi_response["current"].get("last_updated_epoch"),
+            })
+
+    df = pd.DataFrame(state_aqi_data, columns=["Station ID", "State", "City"] + NUMERIC_COLUMNS + ["Reading Time"])
+    df = df[df["PM2.5 (μg/m³)"] != "N/A"].reset_index(drop=True)
+    # Missing pollutants become NaN so the frame has one type per column.
+    for column in NUMERIC_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    df.insert(4, "PM2.5 Category (DEFRA)", defra_pm25_category(df["PM2.5 (μg/m³)"]))
+    # Indices are computed at ingest, so nothing downstream waits on a
+    # warehouse refresh just to get AQI values.
+    indices = compute_indices(df, columns=POLLER_COLUMNS)
+    df["AQI"] = indices["AQI"]
+    df["AIR_QUALITY"] = indices["AIR_QUALITY"]
+    failed = {station.city: sweep.failed[station.query] for station in stations if station.query in sweep.failed}
+    return df, failed
+
+
+class AQIPoller:
+    """Polls weatherapi on a background thread and publishes the latest readings.
+
+    Stations from the registry are split into ``shards`` by station id. Each
+    process (a Streamlit server or a ``python -m utils.aqi_poller`` worker)
+    claims a free shard lock under ``LATEST_DIR`` and polls only that shard,
+    with its share of the API rate limit and its first sweep staggered by its
+    shard index. Processes left without a shard just read the files the
+    owners write. Pages read ``latest()`` and never make HTTP calls on a rerun.
+    Every sweep is written to ``spool`` (if given) for the pipeline to load
+    into Snowflake; owners also run it through ``detector``, if given.
+    """
+
+    def __init__(self, api_key, interval=POLL_INTERVAL, shards=1, directory=LATEST_DIR, detector=None,
+                 spool=None):
+        self._interval = interval
+        self._detector = detector
+        self._spool = spool
+        self._shards = shards
+        self._dir = Path(directory)
+        self._client = AQIClient(api_key, rate_limiter=TokenBucket(RATE_PER_SECOND / shards, max(1, BURST // shards)))
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_file = None
+        self._shard = None
+        self._cycle = 0
+        # Own shard's readings, by station, and when they were last swept.
+        self._own = None
+        self._own_failed = {}
+        self._fetched_at = None
+        # Parquet path -> (mtime, frame, meta) for every shard file read.
+        self._loaded = {}
+
+    @property
+    def is_owner(self):
+        return self._thread is not None
+
+    def _shard_path(self, index):
+        return self._dir / f"shard-{index}-of-{self._shards}.parquet"
+
+    def _detector_path(self):
+        return self._shard_path(self._shard).with_suffix(".detector.parquet")
+
+    def _acquire_ownership(self):
+        if fcntl is None:
+            self._shard, self._shards = 0, 1
+            return True
+        self._dir.mkdir(parents=True, exist_ok=True)
+        for index in range(self._shards):
+            lock_file = open(self._shard_path(index).with_suffix(".lock"), "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            self._lock_file, self._shard = lock_file, index
+            return True
+        return False
+
+    def start(self):
+        if self._thread is None and self._acquire_ownership():
+            self._load_own()
+            if self._detector is not None:
+                self._detector.load(self._detector_path())
+            self._thread = threading.Thread(target=self._run, name=f"aqi-poller-{self._shard}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._client.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        if self._fetched_at is None and self._shard:
+            # Spread the shards' sweeps over the interval instead of all at once.
+            self._stop.wait(self._interval * self._shard / self._shards)
+        while not self._stop.is_set():
+            age = time.time() - self._fetched_at if self._fetched_at else None
+            if age is None or age >= self._interval:
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception("AQI sweep failed")
+                age = 0
+            self._stop.wait(self._interval - age)
+
+    def _stations(self):
+        stations = load_stations()
+        if self._shard is None:
+            return stations
+        return due(shard(stations, self._shard, self._shards), self._cycle)
+
+    def poll(self):
+        """Sweep now and publish. Concurrent calls share the sweep in progress.
+
+        A process without a shard sweeps every station and keeps the result
+        in memory only.
+        """
+        started = time.time()
+        with self._sweep_lock:
+            if self._fetched_at and self._fetched_at >= started:
+                return self.latest()
+            stations = self._stations()
+            self._cycle += 1
+            df, failed = fetch_readings(self._client, stations)
+            fetched_at = time.time()
+            if failed:
+                logger.warning("AQI sweep missing %d stations: %s", len(failed), failed)
+            if self._spool is not None:
+                self._spool.append(df, fetched_at)
+            if self._detector is not None and self._shard is not None:
+                self._detector.process(df)
+                self._detector.save(self._detector_path())
+            if self._own is not None and self._shard is not None:
+                # Stations not due this cycle keep their previous reading.
+                previous = self._own[~self._own["Station ID"].isin(df["Station ID"])]
+                df = pd.concat([previous, df], ignore_index=True) if not previous.empty else df
+            self._publish(df, fetched_at, failed)
+        return self.latest()
+
+    def _publish(self, df, fetched_at, failed):
+        with self._lock:
+            self._own = df
+            self._fetched_at = fetched_at
+            self._own_failed = failed
+        if self._shard is None:
+            return
+        path = self._shard_path(self._shard)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta_tmp = path.with_name(f".{path.stem}.json.tmp")
+        meta_tmp.write_text(json.dumps({"fetched_at": fetched_at, "failed": failed}))
+        os.replace(meta_tmp, path.with_suffix(".json"))
+        tmp = path.with_name(f".{path.name}.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    def _read_shard(self, path):
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        cached = self._loaded.get(path)
+        if cached and cached[0] == mtime:
+            return cached
+        try:
+            df = pd.read_parquet(path)
+            meta = json.loads(path.with_suffix(".json").read_text())
+        except (OSError, ValueError):
+            return cached
+        self._loaded[path] = (mtime, df, meta)
+        return self._loaded[path]
+
+    def _load_own(self):
+        loaded = self._read_shard(self._shard_path(self._shard))
+        if loaded:
+            _, df, meta = loaded
+            self._own, self._fetched_at = df, meta.get("fetched_at")
+
+    def _snapshot(self):
+        # (frame, fetched_at, failed) across every shard's latest file.
+        with self._lock:
+            shards = [self._read_shard(self._shard_path(index)) for index in range(self._shards)]
+            shards = [loaded for loaded in shards if loaded]
+            if not shards:
+                if self._own is None:
+                    return None, None, {}
+                return self._own, self._fetched_at, self._own_failed
+            failed = {}
+            for _, _, meta in shards:
+                failed.update(meta.get("failed", {}))
+            df = pd.concat([frame for _, frame, _ in shards], ignore_index=True)
+            return df, max(meta.get("fetched_at") or 0 for _, _, meta in shards), failed
+
+    def failed_cities(self):
+        """Cities the last sweep of each shard could not fetch, with the reason."""
+        return self._snapshot()[2]
+
+    def latest(self):
+        """``(frame, fetched_at)`` for the last published readings, or ``(None, None)``."""
+        df, fetched_at, _ = self._snapshot()
+        if df is None:
+            return None, None
+        return df.copy(), fetched_at
+
+
+def make_detector(alert_webhook=None):
+    """Detector writing alerts to the local alerts file and, if set, a webhook."""
+    sinks = [JsonlFileSink()]
+    if alert_webhook:
+        sinks.append(WebhookSink(alert_webhook))
+    return AnomalyDetector(sinks)
+
+
+@st.cache_resource(show_spinner=False)
+def get_aqi_poller(api_key, interval=POLL_INTERVAL, shards=1, alert_webhook=None):
+    return AQIPoller(api_key, interval, shards, detector=make_detector(alert_webhook), spool=Spool()).start()
+
+
+def _worker(api_key, interval, shards, alert_webhook):
+    poller = AQIPoller(api_key, interval, shards, detector=make_detector(alert_webhook), spool=Spool()).start()
+    if not poller.is_owner:
+        logger.warning("All %d AQI shards are already being polled", shards)
+        return
+    poller.join()
+
+
+def run_workers(api_key, shards, interval=POLL_INTERVAL, alert_webhook=None):
+    """Poll every shard from its own process, outside any Streamlit server."""
+    processes = [
+        multiprocessing.Process(target=_worker, args=(api_key, interval, shards, alert_webhook),
+                                name=f"aqi-poller-{index}")
+        for index in range(shards)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run sharded AQI poller workers.")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--interval", type=int, default=POLL_INTERVAL)
+    parser.add_argument("--alert-webhook", help="URL to POST AQI alerts to")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    run_workers(os.environ["WEATHERAPI_KEY"], args.shards, args.interval, args.alert_webhook)
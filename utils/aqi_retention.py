@@ -0,0 +1,135 @@
+# Tiered retention for the AQI history in Snowflake:
+#
+#   T01_AQI_FOR_INDIAN_STATES  raw readings, kept for ``raw_days``
+#   T01_AQI_HOURLY_ROLLUP      hourly count/sum/min/max per city and pollutant,
+#                              kept for ``hourly_days``
+#   T01_AQI_DAILY_ROLLUP       daily count/sum/min/max, kept forever
+#
+# Each step merges the rows past the cutoff into the next tier and deletes them
+# in one transaction. The merge adds to existing buckets, so a rerun (or a
+# bucket that straddles the cutoff) is never counted twice, and a rerun with
+# nothing past the cutoff is a no-op.
+import time
+from typing import NamedTuple
+
+import pandas as pd
+
+from utils.aqi_loader import AQI_TABLE
+from utils.snapshot_store import prune
+
+HOURLY_TABLE = "T01_AQI_HOURLY_ROLLUP"
+DAILY_TABLE = "T01_AQI_DAILY_ROLLUP"
+SERVING_SNAPSHOT = "T01_DYNAMIC_AQI_FOR_INDIAN_STATES"
+# How often the pipeline runs retention, in seconds.
+RETENTION_INTERVAL = 24 * 60 * 60
+RAW_RETENTION_DAYS = 30
+HOURLY_RETENTION_DAYS = 365
+
+ROLLUP_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    BUCKET TIMESTAMP_NTZ,
+    STATE VARCHAR,
+    CITY VARCHAR,
+    POLLUTANT VARCHAR,
+    N NUMBER,
+    TOTAL FLOAT,
+    MIN_VALUE FLOAT,
+    MAX_VALUE FLOAT
+)
+"""
+
+RAW_SOURCE = f"""
+SELECT DATE_TRUNC('HOUR', INSRT_TIMESTAMP) AS BUCKET, STATE, CITY, POLLUTANT,
+       COUNT(*) AS N, SUM(VALUE) AS TOTAL, MIN(VALUE) AS MIN_VALUE, MAX(VALUE) AS MAX_VALUE
+FROM (SELECT INSRT_TIMESTAMP, STATE, CITY, PM25, PM10, CO, O3, NO2, SO2 FROM {AQI_TABLE}
+      WHERE INSRT_TIMESTAMP < %(cutoff)s)
+    UNPIVOT (VALUE FOR POLLUTANT IN (PM25, PM10, CO, O3, NO2, SO2))
+GROUP BY 1, 2, 3, 4
+"""
+
+HOURLY_SOURCE = f"""
+SELECT DATE_TRUNC('DAY', BUCKET) AS BUCKET, STATE, CITY, POLLUTANT,
+       SUM(N) AS N, SUM(TOTAL) AS TOTAL, MIN(MIN_VALUE) AS MIN_VALUE, MAX(MAX_VALUE) AS MAX_VALUE
+FROM {HOURLY_TABLE}
+WHERE BUCKET < %(cutoff)s
+GROUP BY 1, 2, 3, 4
+"""
+
+MERGE_QUERY = """
+MERGE INTO {target} t USING ({source}) s
+ON t.BUCKET = s.BUCKET AND EQUAL_NULL(t.STATE, s.STATE) AND EQUAL_NULL(t.CITY, s.CITY)
+   AND t.POLLUTANT = s.POLLUTANT
+WHEN MATCHED THEN UPDATE SET
+    N = t.N + s.N, TOTAL = t.TOTAL + s.TOTAL,
+    MIN_VALUE = LEAST(t.MIN_VALUE, s.MIN_VALUE), MAX_VALUE = GREATEST(t.MAX_VALUE, s.MAX_VALUE)
+WHEN NOT MATCHED THEN INSERT (BUCKET, STATE, CITY, POLLUTANT, N, TOTAL, MIN_VALUE, MAX_VALUE)
+    VALUES (s.BUCKET, s.STATE, s.CITY, s.POLLUTANT, s.N, s.TOTAL, s.MIN_VALUE, s.MAX_VALUE)
+"""
+
+TABLE_BYTES_QUERY = """
+SELECT TABLE_NAME, BYTES FROM INFORMATION_SCHEMA.TABLES
+WHERE TABLE_SCHEMA = CURRENT_SCHEMA() AND TABLE_NAME IN (%s, %s, %s)
+"""
+
+
+class RetentionPolicy(NamedTuple):
+    raw_days: int = RAW_RETENTION_DAYS
+    hourly_days: int = HOURLY_RETENTION_DAYS
+
+
+class RetentionReport(NamedTuple):
+    ran_at: float
+    raw_rows_compacted: int
+    hourly_rows_compacted: int
+    # Active bytes of the three tables before minus after. Deleted rows stay
+    # in Time Travel / Fail-safe storage until those windows pass.
+    warehouse_bytes_reclaimed: int
+    snapshot_bytes_reclaimed: int
+
+
+def _cutoff(days):
+    # Naive IST, like INSRT_TIMESTAMP, floored to midnight so whole days move.
+    now = pd.Timestamp.now(tz="Asia/Kolkata").tz_localize(None)
+    return (now - pd.Timedelta(days=days)).floor("D").to_pydatetime()
+
+
+def _table_bytes(cursor):
+    cursor.execute(TABLE_BYTES_QUERY, (AQI_TABLE, HOURLY_TABLE, DAILY_TABLE))
+    return sum(bytes_ or 0 for _, bytes_ in cursor.fetchall())
+
+
+def _compact(cursor, source, target, delete_from, cutoff_column, cutoff):
+    # One transaction: the rows land in the next tier and leave this one together.
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute(MERGE_QUERY.format(target=target, source=source), {"cutoff": cutoff})
+        cursor.execute(f"DELETE FROM {delete_from} WHERE {cutoff_column} < %(cutoff)s", {"cutoff": cutoff})
+        deleted = cursor.rowcount or 0
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    return deleted
+
+
+def apply_retention(conn, policy=RetentionPolicy()):
+    """Compact raw readings past ``policy.raw_days`` into hourly rollups, and
+    hourly rollups past ``policy.hourly_days`` into daily ones.
+
+    The local snapshot of the serving table is pruned to the raw window too;
+    its history stays available from the local rollups.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(ROLLUP_DDL.format(table=HOURLY_TABLE))
+        cursor.execute(ROLLUP_DDL.format(table=DAILY_TABLE))
+        before = _table_bytes(cursor)
+        raw_cutoff = _cutoff(policy.raw_days)
+        raw_rows = _compact(cursor, RAW_SOURCE, HOURLY_TABLE, AQI_TABLE, "INSRT_TIMESTAMP", raw_cutoff)
+        hourly_rows = _compact(cursor, HOURLY_SOURCE, DAILY_TABLE, HOURLY_TABLE, "BUCKET",
+                               _cutoff(policy.hourly_days))
+        after = _table_bytes(cursor)
+    finally:
+        cursor.close()
+    snapshot_bytes = prune(SERVING_SNAPSHOT, raw_cutoff)
+    return RetentionReport(time.time(), raw_rows, hourly_rows, max(0, before - after), snapshot_bytes)
@@ -0,0 +1,412 @@
+# Hourly and daily AQI rollups per city and per state, kept as local Parquet
+# next to the snapshots. The rows each snapshot sync brings in (one or more poll
+# batches) are written as one small delta file of per-reading partials; a
+# background thread later folds the deltas into the partitions they touch, and
+# reads fold in whatever is still pending. A sync never reads or rewrites
+# existing rollups, so its cost depends only on the batch, not on how much
+# history has accumulated.
+#
+# Every rollup row holds count, sum, min, max and a log-spaced histogram of the
+# values, all of which merge by addition / min / max. The histogram is stored
+# sparsely (the non-empty bins and their counts): a city-hour has a handful of
+# readings, so it touches a handful of bins. Mean is sum / count and p95 is
+# read off the histogram, accurate to about 6%.
+#
+# The serving table only holds the raw retention window, so after a full
+# resync the rollups are seeded from the warehouse rollup tables that
+# retention compacts older readings into.
+#
+# Which files make up each rollup is recorded in _meta.json, replaced
+# atomically. Files a compaction supersedes are deleted only after the swap,
+# so a reader sees either the old set or the new one, never both.
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from utils.aqi_loader import READING_COLUMNS
+from utils.aqi_retention import DAILY_TABLE, HOURLY_TABLE
+from utils.snapshot_store import SNAPSHOT_DIR, on_sync
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_DIR = SNAPSHOT_DIR / "aqi_rollups"
+POLLUTANTS = ["PM25", "PM10", "CO", "O3", "NO2", "SO2", "AQI"]
+# grain -> (bucket frequency, partition file name format)
+GRAINS = {
+    "hourly": ("h", "%Y-%m-%d"),
+    "daily": ("D", "%Y-%m"),
+}
+LEVELS = {
+    "city": ["STATE", "CITY"],
+    "state": ["STATE"],
+}
+# Histogram bin edges: bin 0 is [0, 0.1), then log-spaced up to 1e5 (CO in μg/m³
+# is the largest reading); values past the last edge land in the last bin.
+HIST_EDGES = np.concatenate([[0.0], np.geomspace(0.1, 1e5, 128)])
+HIST_BINS = len(HIST_EDGES) - 1
+STATS = ["COUNT", "SUM", "MIN", "MAX"]
+DELTA_COLUMNS = ["STATE", "CITY", "TIMESTAMP", "POLLUTANT", *STATS, "BIN"]
+# Batch ids already folded in, so a retried batch is not counted twice.
+APPLIED_BATCHES_KEPT = 5000
+# History older than the serving table, from the rollup tables retention
+# keeps next to it; a full resync seeds the local rollups with it.
+SEED_QUERY = f"""
+SELECT BUCKET, STATE, CITY, POLLUTANT, N, TOTAL, MIN_VALUE, MAX_VALUE, 'hourly' AS TIER
+FROM IND_DB.IND_SCH.{HOURLY_TABLE} WHERE BUCKET < %s
+UNION ALL
+SELECT BUCKET, STATE, CITY, POLLUTANT, N, TOTAL, MIN_VALUE, MAX_VALUE, 'daily' AS TIER
+FROM IND_DB.IND_SCH.{DAILY_TABLE} WHERE BUCKET < %s
+"""
+# Seconds between background compactions, and the pending deltas (files or
+# readings) that trigger one early.
+COMPACT_INTERVAL = 5 * 60
+MAX_DELTAS = 32
+MAX_DELTA_ROWS = 50_000
+
+# Guards _meta.json; held only to read-modify-write it, never across a merge.
+_lock = threading.Lock()
+# One compaction at a time.
+_compact_lock = threading.Lock()
+_wake = threading.Event()
+_compactor = None
+_compactor_lock = threading.Lock()
+
+
+def _rollup_key(grain, level):
+    return f"{grain}/{level}"
+
+
+def _read_meta():
+    path = ROLLUP_DIR / "_meta.json"
+    meta = json.loads(path.read_text()) if path.exists() else {}
+    meta.setdefault("seq", 0)
+    meta.setdefault("generation", 0)
+    meta.setdefault("batches", [])
+    # [file, readings] of every delta not yet compacted, oldest first.
+    meta.setdefault("deltas", [])
+    # "grain/level" -> partition -> file.
+    meta.setdefault("partitions", {})
+    return meta
+
+
+def _write_meta(meta):
+    ROLLUP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = ROLLUP_DIR / "_meta.json.tmp"
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, ROLLUP_DIR / "_meta.json")
+
+
+def _write_file(relative, df):
+    path = ROLLUP_DIR / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _unlink(relatives):
+    for relative in relatives:
+        try:
+            (ROLLUP_DIR / relative).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _readings(frame, timestamp_column):
+    # One partial aggregate per reading: long format, one row per pollutant,
+    # with the reading's histogram bin in BIN.
+    frame = frame.rename(columns=READING_COLUMNS)
+    present = [p for p in POLLUTANTS if p in frame.columns]
+    long = frame.melt(id_vars=["STATE", "CITY", timestamp_column], value_vars=present,
+                      var_name="POLLUTANT", value_name="VALUE")
+    long["VALUE"] = pd.to_numeric(long["VALUE"], errors="coerce")
+    long = long.dropna(subset=["VALUE"]).reset_index(drop=True)
+    values = long["VALUE"].to_numpy(dtype=float)
+    return long.assign(
+        TIMESTAMP=pd.to_datetime(long[timestamp_column]),
+        COUNT=1, SUM=values, MIN=values, MAX=values,
+        BIN=np.clip(np.searchsorted(HIST_EDGES, values, side="right") - 1, 0, HIST_BINS - 1),
+    )
+
+
+def _hist_entries(df):
+    # (row, bin, count) for every non-empty histogram bin of every row.
+    if "BIN" in df.columns:
+        return np.arange(len(df)), df["BIN"].to_numpy(dtype=np.int64), np.ones(len(df), dtype=np.int64)
+    lengths = df["HIST_BIN"].map(len).to_numpy(dtype=np.int64)
+    rows = np.repeat(np.arange(len(df)), lengths)
+    if not len(rows):
+        return rows, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    bins = np.concatenate(df["HIST_BIN"].to_numpy()).astype(np.int64)
+    counts = np.concatenate(df["HIST_COUNT"].to_numpy()).astype(np.int64)
+    return rows, bins, counts
+
+
+def _merge(parts, keys):
+    # Combine rows sharing ``keys``; histogram bins come out sorted per row.
+    rows, bins, counts, offset = [], [], [], 0
+    for part in parts:
+        r, b, c = _hist_entries(part)
+        rows.append(r + offset)
+        bins.append(b)
+        counts.append(c)
+        offset += len(part)
+    combined = pd.concat([part[keys + STATS] for part in parts], ignore_index=True)
+    grouped = combined.groupby(keys, sort=True, dropna=False)
+    out = grouped.agg(COUNT=("COUNT", "sum"), SUM=("SUM", "sum"), MIN=("MIN", "min"), MAX=("MAX", "max")).reset_index()
+    group = grouped.ngroup().to_numpy()[np.concatenate(rows)]
+    cells, inverse = np.unique(group * HIST_BINS + np.concatenate(bins), return_inverse=True)
+    totals = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+    splits = np.searchsorted(cells // HIST_BINS, np.arange(1, len(out)))
+    # [:len(out)]: splitting an empty array still yields one (empty) piece.
+    out["HIST_BIN"] = np.split((cells % HIST_BINS).astype(np.int16), splits)[:len(out)]
+    out["HIST_COUNT"] = np.split(totals, splits)[:len(out)]
+    return out
+
+
+def _aggregate(readings, grain, level):
+    # Per-reading partials (a delta) -> rollup rows of one grain and level.
+    bucketed = readings.assign(BUCKET=readings["TIMESTAMP"].dt.floor(GRAINS[grain][0]))
+    return _merge([bucketed], ["BUCKET", *LEVELS[level], "POLLUTANT"])
+
+
+def update_rollups(frame, batch_id, timestamp_column="INSRT_TIMESTAMP"):
+    """Fold one batch of readings into every hourly and daily rollup.
+
+    ``frame`` is either a poller frame or shaped like the AQI tables, with the
+    reading time (naive IST) in ``timestamp_column``. The batch is written as
+    a single delta; merging it into the partitions happens in the background.
+    A ``batch_id`` seen before is ignored. Returns False in that case.
+    """
+    readings = _readings(frame, timestamp_column)[DELTA_COLUMNS]
+    with _lock:
+        meta = _read_meta()
+        if batch_id in meta["batches"]:
+            return False
+        if len(readings):
+            meta["seq"] += 1
+            relative = f"deltas/delta-{meta['seq']:08d}.parquet"
+            _write_file(relative, readings)
+            meta["deltas"].append([relative, len(readings)])
+        meta["batches"] = (meta["batches"] + [batch_id])[-APPLIED_BATCHES_KEPT:]
+        _write_meta(meta)
+        backlog = meta["deltas"]
+    _start_compactor()
+    if len(backlog) >= MAX_DELTAS or sum(rows for _, rows in backlog) >= MAX_DELTA_ROWS:
+        _wake.set()
+    return True
+
+
+def compact():
+    """Merge every pending delta into its partitions; returns how many deltas were merged."""
+    with _compact_lock:
+        deltas = [relative for relative, _ in _read_meta()["deltas"]]
+        if not deltas:
+            return 0
+        seq, generation, partitions = _begin_merge()
+        readings = pd.concat([pd.read_parquet(ROLLUP_DIR / d) for d in deltas], ignore_index=True)
+        rollups = {(grain, level): _aggregate(readings, grain, level) for grain in GRAINS for level in LEVELS}
+        _publish(_write_partitions(rollups, partitions, seq), generation, deltas)
+        return len(deltas)
+
+
+def _begin_merge():
+    # A fresh sequence number for the files a merge writes, and what it merges into.
+    with _lock:
+        meta = _read_meta()
+        meta["seq"] += 1
+        _write_meta(meta)
+        partitions = {key: dict(files) for key, files in meta["partitions"].items()}
+        return meta["seq"], meta["generation"], partitions
+
+
+def _write_partitions(rollups, partitions, seq):
+    # Merge each (grain, level) -> rollup rows into the partitions they fall
+    # in, as new files; returns "grain/level" -> partition -> new file.
+    written = {}
+    for (grain, level), rollup in rollups.items():
+        key = _rollup_key(grain, level)
+        for partition, rows in rollup.groupby(rollup["BUCKET"].dt.strftime(GRAINS[grain][1])):
+            parts = [rows.reset_index(drop=True)]
+            existing = partitions.get(key, {}).get(partition)
+            if existing:
+                parts.insert(0, pd.read_parquet(ROLLUP_DIR / existing))
+            relative = f"{key}/{partition}.{seq:08d}.parquet"
+            _write_file(relative, _merge(parts, ["BUCKET", *LEVELS[level], "POLLUTANT"]))
+            written.setdefault(key, {})[partition] = relative
+    return written
+
+
+def _publish(written, generation, deltas=(), **updates):
+    # Swap the new files (and ``updates``) into the manifest, dropping the
+    # merged ``deltas``, then delete what they replace.
+    with _lock:
+        meta = _read_meta()
+        if meta["generation"] != generation:
+            # Cleared while merging: what was merged is gone.
+            superseded = [relative for files in written.values() for relative in files.values()]
+        else:
+            superseded = list(deltas)
+            for key, files in written.items():
+                current = meta["partitions"].setdefault(key, {})
+                for partition, relative in files.items():
+                    if partition in current:
+                        superseded.append(current[partition])
+                    current[partition] = relative
+            meta["deltas"] = [d for d in meta["deltas"] if d[0] not in deltas]
+            meta.update(updates)
+            _write_meta(meta)
+    _unlink(superseded)
+
+
+def _compact_periodically():
+    while True:
+        _wake.wait(COMPACT_INTERVAL)
+        _wake.clear()
+        try:
+            compact()
+        except Exception:
+            logger.exception("AQI rollup compaction failed")
+
+
+def _start_compactor():
+    global _compactor
+    with _compactor_lock:
+        if _compactor is None:
+            _compactor = threading.Thread(target=_compact_periodically, name="aqi-rollup-compactor", daemon=True)
+            _compactor.start()
+
+
+def clear_rollups(**meta):
+    """Drop every rollup; ``meta`` is kept in the fresh manifest."""
+    with _lock:
+        generation = _read_meta()["generation"] + 1
+        shutil.rmtree(ROLLUP_DIR, ignore_errors=True)
+        _write_meta({**meta, "generation": generation})
+
+
+def seed_rollups(history):
+    """Merge older history, as rows of the warehouse rollup tables, into the rollups.
+
+    ``history`` has ``BUCKET``, ``STATE``, ``CITY``, ``POLLUTANT``, ``N``,
+    ``TOTAL``, ``MIN_VALUE``, ``MAX_VALUE`` and ``TIER`` ("hourly" or
+    "daily", the table it came from). Those tables keep no histogram, so
+    rollups built from them have no P95.
+    """
+    history = history.rename(columns={"N": "COUNT", "TOTAL": "SUM", "MIN_VALUE": "MIN", "MAX_VALUE": "MAX"})
+    history = history.assign(
+        BUCKET=pd.to_datetime(history["BUCKET"]),
+        HIST_BIN=[np.empty(0, dtype=np.int16)] * len(history),
+        HIST_COUNT=[np.empty(0, dtype=np.int64)] * len(history),
+    )
+    by_grain = {
+        "hourly": history[history["TIER"] == "hourly"],
+        "daily": history.assign(BUCKET=history["BUCKET"].dt.floor("D")),
+    }
+    rollups = {
+        (grain, level): _merge([rows.reset_index(drop=True)], ["BUCKET", *LEVELS[level], "POLLUTANT"])
+        for grain, rows in by_grain.items() if len(rows) for level in LEVELS
+    }
+    with _compact_lock:
+        seq, generation, partitions = _begin_merge()
+        _publish(_write_partitions(rollups, partitions, seq), generation, seed_before=None)
+
+
+@on_sync("T01_DYNAMIC_AQI_FOR_INDIAN_STATES")
+def _fold_synced_rows(table, replaced, query):
+    if replaced:
+        # The serving table only holds the raw retention window; what came
+        # before it is in the warehouse rollups. Seeded after the fold, and
+        # retried on later syncs until it succeeds.
+        start = pc.min(table["INSRT_TIMESTAMP"]).as_py() if table.num_rows else None
+        before = pd.Timestamp.now(tz="Asia/Kolkata").tz_localize(None) if start is None else pd.Timestamp(start)
+        clear_rollups(seed_before=str(before.floor("h")))
+    if table.num_rows:
+        frame = table.to_pandas()
+        # Keyed on the rows themselves: a rewound sync can bring rows no newer
+        # than an earlier sync's, so the max timestamp alone could repeat.
+        rows = pd.util.hash_pandas_object(frame[["STATE", "CITY", "INSRT_TIMESTAMP"]], index=False)
+        update_rollups(frame, f"sync-{hashlib.sha1(rows.to_numpy().tobytes()).hexdigest()[:16]}")
+    before = _read_meta().get("seed_before")
+    if before is not None:
+        try:
+            seed_rollups(query(SEED_QUERY, (before, before)))
+        except Exception:
+            logger.warning("Seeding AQI rollups from %s failed, retrying on the next sync", HOURLY_TABLE,
+                           exc_info=True)
+
+
+def _quantile(df, q):
+    # Nearest-rank quantile over the histogram, reported at the bin's midpoint.
+    rows, bins, counts = _hist_entries(df)
+    target = np.ceil(q * df["COUNT"].to_numpy(dtype=float))
+    cumulative = pd.Series(counts).groupby(rows).cumsum().to_numpy()
+    reached = np.flatnonzero(cumulative >= target[rows])
+    first = pd.Series(reached).groupby(rows[reached]).first()
+    chosen = np.full(len(df), HIST_BINS - 1)
+    chosen[first.index.to_numpy()] = bins[first.to_numpy()]
+    lo, hi = HIST_EDGES[chosen], HIST_EDGES[chosen + 1]
+    mid = np.where(lo > 0, np.sqrt(lo * hi), hi / 2)
+    # min and max are exact, so small buckets come out exact too.
+    quantile = np.clip(mid, df["MIN"].to_numpy(dtype=float), df["MAX"].to_numpy(dtype=float))
+    # Buckets seeded from the warehouse rollups don't have every reading binned.
+    binned = np.bincount(rows, weights=counts, minlength=len(df))
+    return np.where(binned < df["COUNT"].to_numpy(dtype=float), np.nan, quantile)
+
+
+def _read_rollup_rows(grain, level, columns, filters):
+    # Compacted partitions (filters pushed down) plus pending deltas
+    # aggregated on the fly. Retried when a compaction deletes a file between
+    # reading the manifest and opening it: by then the manifest names its
+    # replacement.
+    expression = pq.filters_to_expression(filters) if filters else None
+    for attempt in range(3):
+        meta = _read_meta()
+        partitions = list(meta["partitions"].get(_rollup_key(grain, level), {}).values())
+        deltas = [relative for relative, _ in meta["deltas"]]
+        try:
+            parts = []
+            if partitions:
+                dataset = pq.ParquetDataset([str(ROLLUP_DIR / r) for r in partitions], filters=filters or None)
+                parts.append(dataset.read(columns=columns).to_pandas())
+            if deltas:
+                readings = pd.concat([pd.read_parquet(ROLLUP_DIR / d) for d in deltas], ignore_index=True)
+                pending = pa.Table.from_pandas(_aggregate(readings, grain, level), preserve_index=False)
+                if expression is not None:
+                    pending = pending.filter(expression)
+                parts.append(pending.select(columns).to_pandas())
+            return parts
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+
+
+def read_rollup(grain, level="city", pollutants=None, filters=None):
+    """Rollup rows (``BUCKET``, keys, ``POLLUTANT``, COUNT/MIN/MAX/MEAN/P95) for one grain and level.
+
+    ``filters`` are pushed down into the Parquet read as in
+    ``snapshot_store.read_table``; e.g. ``[("CITY", "=", "Patna")]``.
+    Deltas not yet compacted are merged in on the fly. P95 is NaN for
+    buckets seeded from the warehouse rollups (see ``seed_rollups``).
+    """
+    keys = ["BUCKET", *LEVELS[level], "POLLUTANT"]
+    filters = list(filters or [])
+    if pollutants:
+        filters.append(("POLLUTANT", "in", list(pollutants)))
+    parts = [part for part in _read_rollup_rows(grain, level, keys + STATS + ["HIST_BIN", "HIST_COUNT"], filters)
+             if len(part)]
+    if not parts:
+        return pd.DataFrame(columns=keys + ["COUNT", "MIN", "MAX", "MEAN", "P95"])
+    df = _merge(parts, keys)
+    df["MEAN"] = df["SUM"] / df["COUNT"]
+    df["P95"] = _quantile(df, 0.95)
+    return df.drop(columns=["SUM", "HIST_BIN", "HIST_COUNT"]).sort_values("BUCKET").reset_index(drop=True)
@@ -0,0 +1,128 @@
+# Durable local spool for AQI readings. Every sweep lands here first (SQLite in
+# WAL mode, so pollers and the flusher can write and read concurrently), and
+# the pipeline drains it to Snowflake in bulk whenever the warehouse is up.
+# Readings are keyed on (state, city, reading time): polling the same
+# observation twice, or spooling a sweep again, stores it once.
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+
+SPOOL_PATH = Path(".snapshots/aqi_spool.db")
+# Rows per Snowflake load.
+FLUSH_BATCH_SIZE = 5000
+# Flushed rows are kept this long so a late duplicate is still recognised.
+KEEP_FLUSHED = 7 * 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    state TEXT NOT NULL,
+    city TEXT NOT NULL,
+    reading_time INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    spooled_at REAL NOT NULL,
+    flush_batch TEXT,
+    flushed_at REAL,
+    PRIMARY KEY (state, city, reading_time)
+);
+CREATE INDEX IF NOT EXISTS readings_pending ON readings (flushed_at, flush_batch);
+"""
+
+
+class Spool:
+    def __init__(self, path=SPOOL_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def append(self, df, fetched_at):
+        """Spool one sweep; returns how many readings were new.
+
+        Rows without a weatherapi reading time are keyed on ``fetched_at``.
+        """
+        if df.empty:
+            return 0
+        if "Reading Time" in df.columns:
+            reading_times = pd.to_numeric(df["Reading Time"], errors="coerce")
+        else:
+            reading_times = [None] * len(df)
+        rows = []
+        for record, reading_time in zip(df.to_dict("records"), reading_times):
+            reading_time = int(fetched_at if pd.isna(reading_time) else reading_time)
+            payload = {k: (None if isinstance(v, float) and pd.isna(v) else v) for k, v in record.items()}
+            payload["Reading Time"] = reading_time
+            rows.append((record["State"], record["City"], reading_time, json.dumps(payload, default=str), time.time()))
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO readings (state, city, reading_time, payload, spooled_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def claim(self, limit=FLUSH_BATCH_SIZE):
+        """``(flush_batch, frame)`` of readings to load next, or ``(None, None)``.
+
+        A batch that was claimed but never marked flushed is handed out again
+        with the same id, so the retry replaces rather than duplicates it.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT flush_batch FROM readings WHERE flushed_at IS NULL AND flush_batch IS NOT NULL LIMIT 1"
+                ).fetchone()
+                if row:
+                    batch = row[0]
+                else:
+                    batch = f"spool-{uuid.uuid4().hex[:16]}"
+                    claimed = self._conn.execute(
+                        "UPDATE readings SET flush_batch = ? WHERE rowid IN (SELECT rowid FROM readings"
+                        " WHERE flushed_at IS NULL AND flush_batch IS NULL ORDER BY rowid LIMIT ?)",
+                        (batch, limit),
+                    ).rowcount
+                    if not claimed:
+                        self._conn.execute("COMMIT")
+                        return None, None
+                payloads = self._conn.execute(
+                    "SELECT payload FROM readings WHERE flush_batch = ? ORDER BY rowid", (batch,)
+                ).fetchall()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return batch, pd.DataFrame([json.loads(payload) for payload, in payloads])
+
+    def mark_flushed(self, batch):
+        with self._lock:
+            self._conn.execute("UPDATE readings SET flushed_at = ? WHERE flush_batch = ?", (time.time(), batch))
+
+    def purge(self, keep=KEEP_FLUSHED):
+        """Drop flushed readings older than ``keep`` seconds; returns how many."""
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM readings WHERE flushed_at IS NOT NULL AND flushed_at < ?", (time.time() - keep,)
+            ).rowcount
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM readings WHERE flushed_at IS NULL").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,69 @@
+# Registry of the locations the AQI poller monitors, loaded from
+# src/AQI_STATIONS.csv (one row per station: STATION_ID, STATE, CITY, LAT, LON,
+# PRIORITY). Adding districts is a data change, not a code change.
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+
+import pandas as pd
+
+STATIONS_CSV = Path("src/AQI_STATIONS.csv")
+# Priority -> poll every N-th cycle. Priority 1 stations are polled on every
+# sweep; lower priorities less often, so adding many low-priority stations
+# doesn't stretch the sweep for the important ones.
+POLL_EVERY = {1: 1, 2: 2, 3: 6}
+
+
+class Station(NamedTuple):
+    station_id: str
+    state: str
+    city: str
+    lat: float
+    lon: float
+    priority: int = 1
+
+    @property
+    def query(self):
+        # weatherapi accepts "lat,lon"; coordinates avoid ambiguous city names.
+        if pd.notna(self.lat) and pd.notna(self.lon):
+            return f"{self.lat},{self.lon}"
+        return self.city
+
+
+_cache = {}
+
+
+def load_stations(path=STATIONS_CSV):
+    """Stations from ``path``, highest priority first. Re-read only when the file changes."""
+    path = Path(path)
+    mtime = path.stat().st_mtime
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    df = pd.read_csv(path)
+    duplicated = df["STATION_ID"][df["STATION_ID"].duplicated()]
+    if not duplicated.empty:
+        raise ValueError(f"Duplicate station ids in {path}: {', '.join(duplicated)}")
+    df["PRIORITY"] = df["PRIORITY"].fillna(1).astype(int)
+    df = df.sort_values(["PRIORITY", "STATION_ID"], kind="stable")
+    stations = [
+        Station(row.STATION_ID, row.STATE, row.CITY, row.LAT, row.LON, row.PRIORITY)
+        for row in df.itertuples(index=False)
+    ]
+    _cache[path] = (mtime, stations)
+    return stations
+
+
+def shard_of(station_id, shards):
+    # crc32 rather than hash(): it must agree across processes.
+    return zlib.crc32(station_id.encode()) % shards
+
+
+def shard(stations, index, shards):
+    """The stations shard ``index`` of ``shards`` is responsible for."""
+    return [s for s in stations if shard_of(s.station_id, shards) == index]
+
+
+def due(stations, cycle):
+    """The stations to poll on sweep number ``cycle``."""
+    return [s for s in stations if cycle % POLL_EVERY.get(s.priority, max(POLL_EVERY.values())) == 0]
@@ -0,0 +1,95 @@
+import pandas as pd
+import pyarrow as pa
+from snowflake.connector.constants import FIELD_ID_TO_NAME
+from snowflake.connector.errors import NotSupportedError
+
+OUTPUTS = ("pandas", "arrow", "batches")
+
+
+def column_types(cursor, dtypes=None):
+    """Arrow types to cast result columns to, keyed by column name.
+
+    NUMBER columns with a scale come back as decimal128, which pandas can only
+    hold as Python Decimal objects, so they are mapped to float64. Anything in
+    ``dtypes`` (Arrow type or alias such as ``"float32"``) overrides the default.
+    """
+    casts = {}
+    for col in cursor.description or []:
+        type_name = FIELD_ID_TO_NAME.get(col.type_code)
+        if type_name == "FIXED" and (col.scale or 0) > 0:
+            casts[col.name] = pa.float64()
+    for name, dtype in (dtypes or {}).items():
+        casts[name] = dtype if isinstance(dtype, pa.DataType) else pa.type_for_alias(dtype)
+    return casts
+
+
+def _apply_types(table, casts):
+    if not casts:
+        return table
+    fields = [
+        pa.field(field.name, casts.get(field.name, field.type), nullable=field.nullable)
+        for field in table.schema
+    ]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def _columns(cursor):
+    return [col[0] for col in cursor.description]
+
+
+def _empty_table(cursor):
+    return pa.table({name: pa.array([], type=pa.null()) for name in _columns(cursor)})
+
+
+def _fetch_rows(cursor):
+    # Statements such as DDL, SHOW/LS and ALTER ... REFRESH return JSON results
+    # that the Arrow fetchers refuse, so fall back to plain row fetching.
+    return pd.DataFrame(cursor.fetchall(), columns=_columns(cursor))
+
+
+def _to_pandas(table):
+    # split_blocks/self_destruct let Arrow release column buffers as they are
+    # converted, so peak memory stays close to the size of the final frame.
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def fetch_table(cursor, dtypes=None):
+    try:
+        table = cursor.fetch_arrow_all()
+    except NotSupportedError:
+        return pa.Table.from_pandas(_fetch_rows(cursor), preserve_index=False)
+    if table is None:
+        table = _empty_table(cursor)
+    return _apply_types(table, column_types(cursor, dtypes))
+
+
+def fetch_frame(cursor, dtypes=None):
+    try:
+        table = cursor.fetch_arrow_all()
+    except NotSupportedError:
+        return _fetch_rows(cursor)
+    if table is None:
+        return pd.DataFrame(columns=_columns(cursor))
+    return _to_pandas(_apply_types(table, column_types(cursor, dtypes)))
+
+
+def fetch_batches(cursor, dtypes=None):
+    """Yield the result as a sequence of DataFrames, one per Arrow result batch."""
+    casts = column_types(cursor, dtypes)
+    try:
+        batches = cursor.fetch_arrow_batches()
+    except NotSupportedError:
+        yield _fetch_rows(cursor)
+        return
+    for table in batches:
+        yield _to_pandas(_apply_types(table, casts))
+
+
+def fetch_result(cursor, output="pandas", dtypes=None):
+    if output == "pandas":
+        return fetch_frame(cursor, dtypes)
+    if output == "arrow":
+        return fetch_table(cursor, dtypes)
+    if output == "batches":
+        return fetch_batches(cursor, dtypes)
+    raise ValueError(f"output must be one of {OUTPUTS}, got {output!r}")
@@ -0,0 +1,98 @@
+# Cortex completions, streamed. SNOWFLAKE.CORTEX.COMPLETE in SQL only returns
+# once the whole answer is generated; the Cortex REST endpoint streams it as
+# server-sent events, so the page can show the first words within a second.
+import json
+import logging
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+COMPLETE_QUERY = "SELECT snowflake.cortex.complete(?, ?) AS response"
+COMPLETE_PATH = "/api/v2/cortex/inference:complete"
+# (connect, read) timeouts; the read timeout is per chunk, not per answer.
+STREAM_TIMEOUT = (10, 120)
+
+
+def complete(session, model, prompt):
+    """The whole completion in one string, through SQL."""
+    return session.sql(COMPLETE_QUERY, params=[model, prompt]).collect()[0].RESPONSE
+
+
+def _open_stream(session, model, prompt):
+    conn = session.connection
+    response = requests.post(
+        f"https://{conn.host}{COMPLETE_PATH}",
+        headers={
+            "Authorization": f'Snowflake Token="{conn.rest.token}"',
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+        },
+        json={"model": model, "messages": [{"role": "user", "content": prompt}], "stream": True},
+        stream=True,
+        timeout=STREAM_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response
+
+
+def _events(response):
+    # Raises on an error event or a data line that isn't JSON.
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            event = None
+            continue
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+            continue
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        payload = json.loads(data)
+        if event == "error" or "error" in payload or "code" in payload:
+            raise RuntimeError(f"Cortex stream error: {payload.get('message') or payload.get('error') or data}")
+        for choice in payload.get("choices", ()):
+            delta = choice.get("delta") or {}
+            text = delta.get("content") or delta.get("text")
+            if text:
+                yield text
+
+
+class CompletionStream:
+    """The chunks of one completion, as Cortex generates them.
+
+    If the stream can't be opened, fails or ends before any text arrives, the
+    blocking SQL completion is yielded as a single chunk instead. Text
+    already shown can't be taken back, so a stream that breaks off after
+    that just ends; ``complete`` tells whether the answer came through whole.
+    """
+
+    def __init__(self, session, model, prompt):
+        self._session = session
+        self._model = model
+        self._prompt = prompt
+        self.complete = False
+
+    def __iter__(self):
+        received = False
+        try:
+            with _open_stream(self._session, self._model, self._prompt) as response:
+                for text in _events(response):
+                    received = True
+                    yield text
+        except Exception:
+            if received:
+                logger.warning("Streaming Cortex completion for %s broke off", self._model, exc_info=True)
+                return
+            logger.warning("Streaming Cortex completion failed for %s, falling back to SQL", self._model, exc_info=True)
+        if not received:
+            yield complete(self._session, self._model, self._prompt)
+        self.complete = True
+
+
+def stream_complete(session, model, prompt):
+    """Iterate the returned ``CompletionStream`` for the completion's chunks."""
+    return CompletionStream(session, model, prompt)
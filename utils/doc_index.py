@@ -0,0 +1,104 @@
+# In-process retrieval over docs_chunks_table. The chunk embeddings are synced
+# into one contiguous, L2-normalised float32 matrix, so a question's top-k is
+# a single matrix-vector product instead of a warehouse scan per question.
+import json
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+CHUNKS_TABLE = "docs_chunks_table"
+EMBED_MODEL = "e5-base-v2"
+# The index checks the table for new or changed documents at most this often.
+SYNC_INTERVAL = 60
+
+# A document's version: its chunk count and an order-independent hash of
+# their text, so a document re-chunked into as many chunks still shows up.
+VERSIONS_QUERY = (
+    f"SELECT RELATIVE_PATH, COUNT(*) AS N, HASH_AGG(CHUNK) AS H FROM {CHUNKS_TABLE} GROUP BY RELATIVE_PATH"
+)
+CHUNKS_QUERY = (
+    f"SELECT RELATIVE_PATH, CHUNK, CHUNK_VEC::ARRAY AS CHUNK_VEC FROM {CHUNKS_TABLE}"
+    " WHERE ARRAY_CONTAINS(RELATIVE_PATH::VARIANT, PARSE_JSON(?))"
+)
+EMBED_QUERY = "SELECT SNOWFLAKE.CORTEX.EMBED_TEXT_768(?, ?)::ARRAY AS VEC"
+
+
+def _vector(value):
+    # ARRAY columns come back as JSON text.
+    return np.asarray(json.loads(value) if isinstance(value, str) else value, dtype=np.float32)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def embed(session, text, model=EMBED_MODEL):
+    """``text`` embedded by Cortex, as a float32 vector."""
+    return _vector(session.sql(EMBED_QUERY, params=[model, text]).collect()[0]["VEC"])
+
+
+class DocIndex:
+    """Exact cosine top-k over the chunks of every document in the stage.
+
+    ``sync`` compares each document's chunk count and content hash with the
+    table and fetches only the documents that are new or changed; documents
+    gone from the table are dropped. Searches read an immutable snapshot of
+    the arrays, so they never wait on a sync.
+    """
+
+    def __init__(self, sync_interval=SYNC_INTERVAL):
+        self._sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._synced_at = None
+        # (matrix, chunks, paths); replaced as a whole on every change.
+        self._snapshot = (np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=object), np.empty(0, dtype=object))
+        # RELATIVE_PATH -> (chunk count, content hash) of what the index holds.
+        self._versions = {}
+
+    def sync(self, session, force=False):
+        """Bring the index up to date with the table; returns whether anything changed."""
+        with self._lock:
+            if not force and self._synced_at is not None and time.monotonic() - self._synced_at < self._sync_interval:
+                return False
+            versions = {row["RELATIVE_PATH"]: (row["N"], row["H"]) for row in session.sql(VERSIONS_QUERY).collect()}
+            stale = [path for path, version in versions.items() if self._versions.get(path) != version]
+            removed = set(self._versions) - set(versions)
+            self._synced_at = time.monotonic()
+            if not stale and not removed:
+                return False
+
+            matrix, chunks, paths = self._snapshot
+            keep = ~np.isin(paths, list(removed | set(stale)))
+            matrix, chunks, paths = matrix[keep], chunks[keep], paths[keep]
+            if stale:
+                fresh = session.sql(CHUNKS_QUERY, params=[json.dumps(stale)]).to_pandas()
+                vectors = _normalize(np.stack([_vector(v) for v in fresh["CHUNK_VEC"]]))
+                matrix = np.concatenate([matrix, vectors]) if len(matrix) else vectors
+                chunks = np.concatenate([chunks, fresh["CHUNK"].to_numpy(dtype=object)])
+                paths = np.concatenate([paths, fresh["RELATIVE_PATH"].to_numpy(dtype=object)])
+            self._snapshot = (np.ascontiguousarray(matrix, dtype=np.float32), chunks, paths)
+            self._versions = versions
+            return True
+
+    def search(self, vector, k):
+        """Top ``k`` chunks by cosine similarity to ``vector``, best first."""
+        matrix, chunks, paths = self._snapshot
+        if not len(matrix):
+            return pd.DataFrame(columns=["CHUNK", "RELATIVE_PATH", "SIMILARITY"])
+        scores = matrix @ _normalize(np.asarray(vector, dtype=np.float32))
+        k = min(k, len(scores))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return pd.DataFrame({"CHUNK": chunks[top], "RELATIVE_PATH": paths[top], "SIMILARITY": scores[top]})
+
+    def __len__(self):
+        return len(self._snapshot[0])
+
+
+@st.cache_resource(show_spinner=False)
+def get_doc_index(account, database, schema):
+    return DocIndex()
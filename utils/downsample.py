@@ -0,0 +1,73 @@
+# Downsampling for time-series charts. A chart only has so many pixels across,
+# so plotting more than a few hundred points per series costs payload and
+# render time without showing anything extra.
+import numpy as np
+import pandas as pd
+
+# Points kept per series; the bucket width follows from the time range shown.
+MAX_POINTS = 500
+
+
+def _as_float(x):
+    if pd.api.types.is_datetime64_any_dtype(x):
+        return pd.to_datetime(x).to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+    return np.asarray(x, dtype=float)
+
+
+def lttb(x, y, threshold):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps.
+
+    The first and last points are always kept; in between, each bucket keeps
+    the point forming the largest triangle with the point kept before it and
+    the average of the next bucket, which preserves peaks and troughs.
+    """
+    x = _as_float(x)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def minmax(x, y, threshold):
+    """Indices of the minimum and maximum of each of ``threshold // 2`` equal-width buckets."""
+    x = _as_float(x)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+    width = (x[-1] - x[0]) / (threshold // 2) or 1.0
+    buckets = pd.Series(y).groupby(np.minimum((x - x[0]) // width, threshold // 2 - 1))
+    return np.unique(np.concatenate([buckets.idxmin().to_numpy(), buckets.idxmax().to_numpy()]))
+
+
+def downsample(df, x, columns, max_points=MAX_POINTS, method="lttb"):
+    """Long-format ``(x, "variable", "value")`` frame with at most ``max_points`` rows per column.
+
+    Each column is reduced on its own, skipping missing values, so a sparse
+    pollutant doesn't drag the others down with it; columns the frame lacks
+    are left out. Plot the result with ``color="variable"``.
+    """
+    pick = {"lttb": lttb, "minmax": minmax}[method]
+    df = df.sort_values(x)
+    parts = []
+    for column in columns:
+        if column not in df.columns:
+            continue
+        series = df[[x, column]].dropna()
+        kept = series.iloc[pick(series[x], series[column], max_points)]
+        parts.append(pd.DataFrame({x: kept[x].to_numpy(), "variable": column, "value": kept[column].to_numpy()}))
+    if not parts:
+        return pd.DataFrame(columns=[x, "variable", "value"])
+    return pd.concat(parts, ignore_index=True)
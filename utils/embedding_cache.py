@@ -0,0 +1,123 @@
+# Cache of Cortex text embeddings, keyed on model and normalised text: an LRU
+# in memory, optionally backed by SQLite so embeddings survive restarts. The
+# same question from any number of sessions costs one EMBED_TEXT_768 call.
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import streamlit as st
+
+from utils.doc_index import EMBED_MODEL, embed
+from utils.single_flight import get_single_flight
+
+EMBEDDINGS_PATH = Path(".snapshots/embeddings.db")
+# Embeddings kept in memory; 768 float32s is 3 KiB, so 10k is about 30 MiB.
+MAX_ENTRIES = 10_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    text TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (model, text)
+)
+"""
+
+
+def normalize_text(text):
+    """Case-folded, with whitespace runs collapsed and the ends trimmed."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of embeddings, written through to ``path`` if given."""
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        # (model, text) -> vector, least recently used first.
+        self._entries = OrderedDict()
+        self._conn = None
+        if path is not None:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, model, text):
+        key = (model, normalize_text(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return vector
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text = ?", key
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.stats["disk_hits"] += 1
+                    return vector
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, model, text, vector):
+        key = (model, normalize_text(text))
+        vector = np.asarray(vector, dtype=np.float32)
+        # Cached vectors are shared between sessions.
+        vector.flags.writeable = False
+        with self._lock:
+            self._remember(key, vector)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                    key + (vector.tobytes(),),
+                )
+        return vector
+
+    def embed(self, session, text, model=EMBED_MODEL):
+        """``text``'s embedding, computed by Cortex only on a miss.
+
+        Concurrent misses for the same text share one Cortex call.
+        """
+        vector = self.get(model, text)
+        if vector is not None:
+            return vector
+
+        def run():
+            # The normalised text is what gets embedded, so every spelling
+            # that shares a key gets the same vector.
+            return self.put(model, text, embed(session, normalize_text(text), model))
+
+        vector, _ = get_single_flight().do(("embedding", model, normalize_text(text)), run)
+        return vector
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+@st.cache_resource(show_spinner=False)
+def get_embedding_cache(path=EMBEDDINGS_PATH):
+    return EmbeddingCache(path)
@@ -0,0 +1,164 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+# Default lifetime of a cached result, in seconds.
+DEFAULT_TTL = 10 * 60
+# Per-table lifetimes. A query touching several tables uses the shortest one.
+TABLE_TTLS = {
+    "T01_AQI_FOR_INDIAN_STATES": 60,
+    "T01_DYNAMIC_AQI_FOR_INDIAN_STATES": 60,
+    "T01_ROAD_ACCIDENTS": 30,
+    "V01_PREDICTED_DATA": 30,
+    "T01_IND_OIL_DEPENDENCY": 24 * 60 * 60,
+    "V01_IND_OIL_DEPENDENCY_FORECAST_2050": 24 * 60 * 60,
+    "V01_IND_AUTOMOBILE_REGISTRATION_DATA": 24 * 60 * 60,
+}
+# Upper bound on the memory held by cached results, across all sessions.
+MEMORY_BUDGET = 256 * 1024 * 1024
+
+_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+(?:IDENTIFIER\(\s*'([^']+)'\s*\)|([\w$.\"]+))", re.IGNORECASE)
+_READ_ONLY = re.compile(r"^\s*\(?\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+def normalize_sql(query):
+    """Collapse whitespace and drop a trailing semicolon, leaving literals untouched."""
+    parts = _LITERAL.split(query)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def referenced_tables(query):
+    """Unqualified, upper-cased names of the tables a query reads from."""
+    tables = set()
+    for identifier, name in _TABLE_REF.findall(query):
+        tables.add((identifier or name).split(".")[-1].strip('"').upper())
+    return tables
+
+
+def is_cacheable(query):
+    return bool(_READ_ONLY.match(query))
+
+
+def _size_of(result):
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(index=True, deep=True).sum())
+    return int(getattr(result, "nbytes", 0))
+
+
+class QueryCache:
+    """Thread-safe TTL + LRU cache of query results, bounded by memory."""
+
+    def __init__(self, memory_budget=MEMORY_BUDGET, default_ttl=DEFAULT_TTL, table_ttls=None):
+        self._memory_budget = memory_budget
+        self._default_ttl = default_ttl
+        self._table_ttls = dict(TABLE_TTLS if table_ttls is None else table_ttls)
+        self._lock = threading.Lock()
+        # key -> (result, expires_at, size, tables), least recently used first.
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def ttl_for(self, tables):
+        ttls = [self._table_ttls[t] for t in tables if t in self._table_ttls]
+        return min(ttls) if ttls else self._default_ttl
+
+    def _drop(self, key):
+        result, _, size, tables = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            result = entry[0]
+        # Pages mutate the frames they get back, so never hand out the cached one.
+        return result.copy() if isinstance(result, pd.DataFrame) else result
+
+    def put(self, key, result, tables):
+        size = _size_of(result)
+        if size > self._memory_budget:
+            return
+        if isinstance(result, pd.DataFrame):
+            result = result.copy()
+        expires_at = time.monotonic() + self.ttl_for(tables)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (result, expires_at, size, frozenset(tables))
+            self._bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while self._bytes > self._memory_budget:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, *tables):
+        """Drop every cached result that read from any of ``tables``."""
+        with self._lock:
+            for table in tables:
+                for key in list(self._by_table.get(table.split(".")[-1].upper(), ())):
+                    self._drop(key)
+                    self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def memory_usage(self):
+        with self._lock:
+            return self._bytes
+
+
+@st.cache_resource(show_spinner=False)
+def get_query_cache():
+    return QueryCache()
+
+
+def cache_key(query, params, context, output="pandas", dtypes=None):
+    return (
+        normalize_sql(query),
+        repr(params),
+        tuple(sorted((k, v) for k, v in context.items() if v)),
+        output,
+        repr(sorted((dtypes or {}).items(), key=lambda item: item[0])),
+    )
+
+
+# Other layers holding copies of table data (e.g. local snapshots) register
+# here to be told when a writer touches a table.
+_invalidation_hooks = []
+
+
+def on_invalidate(hook):
+    if hook not in _invalidation_hooks:
+        _invalidation_hooks.append(hook)
+    return hook
+
+
+def invalidate_tables(*tables):
+    """Invalidation hook for writers: call with every table a write touched."""
+    get_query_cache().invalidate(*tables)
+    for hook in _invalidation_hooks:
+        hook(*tables)
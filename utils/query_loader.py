@@ -0,0 +1,39 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from utils.snowflake_pool import execute_query
+
+MAX_WORKERS = 8
+
+
+class Query(NamedTuple):
+    sql: str
+    params: Optional[object] = None
+    account: Optional[str] = None
+
+
+def load_all(sources, max_workers=MAX_WORKERS):
+    """Load several independent datasets at once and return them by name.
+
+    ``sources`` maps a name to a SQL string, a ``Query``, or a zero-argument
+    callable (e.g. a CSV read). Everything runs on a thread pool, so a page
+    waits roughly as long as its slowest source instead of the sum of all.
+    """
+    # Worker threads need the page's script context to read session state
+    # and to report errors on the right page.
+    ctx = get_script_run_ctx()
+
+    def run(source):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        if isinstance(source, str):
+            return execute_query(source)
+        if isinstance(source, Query):
+            return execute_query(source.sql, source.params, source.account)
+        return source()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(sources)))) as pool:
+        futures = {name: pool.submit(run, source) for name, source in sources.items()}
+        return {name: future.result() for name, future in futures.items()}
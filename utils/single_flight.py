@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import Future
+
+import streamlit as st
+
+
+class _Flight:
+    def __init__(self):
+        self.future = Future()
+        self.followers = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running (followers) wait on the same future and
+    get its result or exception instead of running it again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def do(self, key, fn):
+        """Return ``(result, shared)``; ``shared`` is True if other callers got the same object."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["leaders"] += 1
+            else:
+                flight.followers += 1
+                self.stats["followers"] += 1
+        if not leader:
+            return flight.future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key)
+            flight.future.set_exception(e)
+            raise
+        # Nobody can join once the flight is removed, so the follower count
+        # read here is final.
+        followers = self._finish(key)
+        flight.future.set_result(result)
+        return result, followers > 0
+
+    def _finish(self, key):
+        with self._lock:
+            return self._flights.pop(key).followers
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+@st.cache_resource(show_spinner=False)
+def get_single_flight():
+    return SingleFlight()
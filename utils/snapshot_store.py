@@ -0,0 +1,581 @@
+import functools
+import json
+import logging
+import operator
+import os
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import streamlit as st
+
+from utils.query_cache import on_invalidate
+from utils.snowflake_pool import get_pool, run_query, session_params_from_state
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = Path(".snapshots")
+# Incremental syncs add one Parquet segment each; past this many the table is
+# rewritten as a single file.
+MAX_SEGMENTS = 16
+# Rows per Parquet row group. Each group's min/max lets read_page skip the
+# groups a page can't come from, so this bounds what a page reads.
+ROW_GROUP_SIZE = 64 * 1024
+# After a failed sync, reads don't try again for this long, doubling per
+# consecutive failure up to the cap.
+SYNC_RETRY_BASE = 30
+SYNC_RETRY_MAX = 15 * 60
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+class SnapshotSpec(NamedTuple):
+    # Query whose result is mirrored locally.
+    query: str
+    # Column to sync incrementally on. Without one, the row count is used to
+    # detect changes and the snapshot is refreshed in full when it moves.
+    watermark: Optional[str] = None
+    # Freshness SLA: reads older than this trigger a sync.
+    max_age: float = DAY
+    # Bundled copy served if the warehouse can't be reached and no snapshot exists yet.
+    seed_csv: Optional[str] = None
+    account: Optional[str] = None
+    # Columns that identify a row. Lets a sync re-read from a rewound
+    # watermark (see ``rewind``) without duplicating the rows it already has.
+    key: Optional[tuple] = None
+
+
+SNAPSHOTS = {
+    "T01_DYNAMIC_AQI_FOR_INDIAN_STATES": SnapshotSpec(
+        query="SELECT * FROM IND_DB.IND_SCH.T01_DYNAMIC_AQI_FOR_INDIAN_STATES",
+        watermark="INSRT_TIMESTAMP",
+        max_age=5 * 60,
+        # INSRT_TIMESTAMP is the reading time, so a backlog flushed after an
+        # outage lands behind the watermark; the pipeline rewinds past it.
+        key=("STATE", "CITY", "INSRT_TIMESTAMP"),
+    ),
+    "T01_IND_OIL_DEPENDENCY": SnapshotSpec(
+        query="SELECT * FROM IND_DB.IND_SCH.T01_IND_OIL_DEPENDENCY",
+        seed_csv="src/T01_IND_OIL_DEPENDENCY.csv",
+        account="yy95703.ap-south-1.aws",
+    ),
+    "V01_IND_OIL_DEPENDENCY_FORECAST_2050": SnapshotSpec(
+        query="SELECT * FROM IND_DB.IND_SCH.V01_IND_OIL_DEPENDENCY_FORECAST_2050",
+        account="yy95703.ap-south-1.aws",
+    ),
+    "T01_INDIAN_ROADS": SnapshotSpec(
+        query='''SELECT INDIAN_ROAD_CATEGORY, "2001", "2002", "2003", "2004", "2005", "2006", "2007", "2008", "2009", "2010", "2011", "2012", "2013", "2014", "2015", "2016", "2017", "2018", "2019", "2020", "2021", "2022", "2023" FROM IND_DB.IND_SCH.T01_INDIAN_ROADS''',
+        seed_csv="src/T01_INDIAN_ROADS.csv",
+        max_age=7 * DAY,
+    ),
+    "V01_IND_AUTOMOBILE_REGISTRATION_DATA": SnapshotSpec(
+        query="SELECT * FROM IND_DB.IND_SCH.V01_IND_AUTOMOBILE_REGISTRATION_DATA",
+        seed_csv="src/V01_IND_AUTOMOBILE_REGISTRATION_DATA.csv",
+        max_age=7 * DAY,
+    ),
+    "T01_INDIAN_RAILWAYS_PASSESNGER_CATEGORY": SnapshotSpec(
+        query='''select INDIAN_RAILWAYS_PASSESNGER_CATEGORY as CATEGORY, "1971", "1972", "1973", "1974", "1975", "1976", "1977", "1978", "1979", "1980", "1981", "1982", "1983", "1984", "1985", "1986", "1987", "1988", "1989", "1990", "1991", "1992", "1993", "1994", "1995", "1996", "1997", "1998", "1999", "2000", "2001", "2002", "2003", "2004", "2005", "2006", "2007", "2008", "2009", "2010", "2011", "2012", "2013", "2014", "2015", "2016", "2017", "2018", "2019", "2020", "2021", "2022" from IND_DB.IND_SCH.T01_INDIAN_RAILWAYS_PASSESNGER_CATEGORY''',
+        seed_csv="src/T01_INDIAN_RAILWAYS_PASSESNGER_CATEGORY.csv",
+        max_age=7 * DAY,
+    ),
+    "V01_CIVIL_AVIATION_PASSENGER": SnapshotSpec(
+        query="SELECT * FROM IND_DB.IND_SCH.V01_CIVIL_AVIATION_PASSENGER",
+        seed_csv="src/V01_CIVIL_AVIATION_PASSENGER.csv",
+        max_age=7 * DAY,
+    ),
+    "T01_ROAD_ACC_2019_2022": SnapshotSpec(
+        query="SELECT * FROM IND_DB.IND_SCH.T01_ROAD_ACC_2019_2022",
+        seed_csv="src/T01_ROAD_ACC_2019_2022.csv",
+        max_age=7 * DAY,
+    ),
+    "T01_INFRASTRUCTURE_BUDGET": SnapshotSpec(
+        query="SELECT * FROM IND_DB.IND_SCH.T01_INFRASTRUCTURE_BUDGET",
+        seed_csv="src/T01_INFRASTRUCTURE_BUDGET.csv",
+        max_age=7 * DAY,
+    ),
+}
+
+_locks = {name: threading.Lock() for name in SNAPSHOTS}
+_sync_hooks = {}
+# Guards _syncing (names with a background sync running) and _failures
+# (name -> (consecutive failures, monotonic time to retry at, last error)).
+_state_lock = threading.Lock()
+_syncing = set()
+_failures = {}
+
+
+def on_sync(name):
+    """Register ``hook(table, replaced, query)`` to see the rows each sync of ``name`` brings in.
+
+    ``table`` is the Arrow table of new rows; ``replaced`` is True when the
+    sync rewrote the snapshot in full, so ``table`` is everything.
+    ``query`` is ``run_query`` bound to the sync's connection context, for
+    hooks that need more from the warehouse than the synced rows.
+    """
+    def register(hook):
+        _sync_hooks.setdefault(name, []).append(hook)
+        return hook
+    return register
+
+
+def _run_sync_hooks(name, table, replaced, query):
+    for hook in _sync_hooks.get(name, []):
+        try:
+            hook(table, replaced, query)
+        except Exception:
+            logger.exception("Sync hook %s failed for %s", hook.__name__, name)
+
+
+def _table_dir(name):
+    return SNAPSHOT_DIR / name
+
+
+def read_meta(name):
+    try:
+        return json.loads((_table_dir(name) / "_meta.json").read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _segments(name, meta=None):
+    # The segments _meta.json lists are the snapshot; other part files are
+    # superseded ones not yet deleted or left over from a failed write.
+    meta = read_meta(name) if meta is None else meta
+    if "segments" not in meta:
+        # Written before snapshots listed their segments.
+        return sorted(_table_dir(name).glob("part-*.parquet"))
+    return [_table_dir(name) / segment for segment in meta["segments"]]
+
+
+def _write_meta(name, meta):
+    path = _table_dir(name) / "_meta.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(meta, default=str))
+    os.replace(tmp, path)
+
+
+def _write_segment(path, table):
+    tmp = path.with_name(f".{path.name}.tmp")
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp, path)
+
+
+def _next_segment(name):
+    # Numbered past every part file on disk, listed or not, so a new segment
+    # never overwrites one a reader may still have open.
+    existing = [int(path.stem.split("-")[1]) for path in _table_dir(name).glob("part-*.parquet")]
+    return _table_dir(name) / f"part-{max(existing, default=-1) + 1:05d}.parquet"
+
+
+def _unlink(paths):
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _read_segments(name, columns=None, filters=None, schema=None):
+    # A reader can list the segments just before a sync or prune publishes
+    # their replacement and deletes them; reading the listing again then
+    # finds the replacement.
+    for attempt in range(3):
+        paths = [str(path) for path in _segments(name)]
+        try:
+            return pq.ParquetDataset(paths, filters=filters, schema=schema).read(columns=columns)
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+
+
+def _replace(name, meta, table):
+    # Writes ``table`` as the only segment in ``meta``. Nothing changes for
+    # readers until ``meta`` is written; every older part file, returned, is
+    # deleted only after that.
+    _table_dir(name).mkdir(parents=True, exist_ok=True)
+    old = sorted(_table_dir(name).glob("part-*.parquet"))
+    path = _next_segment(name)
+    _write_segment(path, table)
+    meta["segments"] = [path.name]
+    return old
+
+
+def _append(name, meta, table):
+    # As ``_replace``, for a segment added to those in ``meta``.
+    segments = _segments(name, meta)
+    if not segments or pq.read_metadata(segments[0]).num_rows == 0:
+        return _replace(name, meta, table)
+    # Arrow result batches can pick narrower types from batch to batch, so
+    # every segment is kept on the schema of the first one.
+    schema = pq.read_schema(segments[0])
+    table = table.cast(schema)
+    if len(segments) >= MAX_SEGMENTS:
+        return _replace(name, meta, pa.concat_tables([_read_segments(name, schema=schema), table]))
+    path = _next_segment(name)
+    _write_segment(path, table)
+    meta["segments"] = [segment.name for segment in segments] + [path.name]
+    return []
+
+
+def _max_watermark(table, column):
+    value = pc.max(table[column]).as_py()
+    return None if value is None else str(value)
+
+
+def _drop_known(name, new, spec, since):
+    # Rows of ``new`` whose key the snapshot already holds, from ``since`` on.
+    key = list(spec.key)
+    local = _read_segments(
+        name, columns=key, filters=[(spec.watermark, ">=", pd.Timestamp(since).to_pydatetime())],
+    ).to_pandas()
+    if local.empty:
+        return new
+    incoming = new.select(key).to_pandas()
+    for column in key:
+        incoming[column] = incoming[column].astype(local[column].dtype)
+    known = pd.MultiIndex.from_frame(incoming).isin(pd.MultiIndex.from_frame(local))
+    return new.filter(pa.array(~known))
+
+
+def rewind(name, to):
+    """Make the next sync of ``name`` re-read rows from watermark ``to`` on.
+
+    For rows that reach Snowflake late, with watermark values the snapshot
+    has already passed. Needs ``key`` on the spec; rows already held are skipped.
+    """
+    if SNAPSHOTS[name].key is None:
+        raise ValueError(f"Snapshot {name} has no key to rewind with")
+    with _locks[name]:
+        meta = read_meta(name)
+        if meta.get("watermark") is None:
+            return
+        if meta.get("rewind") is None or pd.Timestamp(to) < pd.Timestamp(meta["rewind"]):
+            meta["rewind"] = str(pd.Timestamp(to))
+        meta["synced_at"] = 0
+        _write_meta(name, meta)
+
+
+def sync(name, force=True, pool=None, session_params=None):
+    """Bring the local snapshot of ``name`` up to date with Snowflake.
+
+    With ``force=False`` nothing is fetched if another caller brought the
+    snapshot within its SLA while this one was waiting for the lock.
+    ``pool`` and ``session_params`` are needed off the script thread, as for
+    ``snowflake_pool.connection``.
+    """
+    spec = SNAPSHOTS[name]
+    query = functools.partial(run_query, account=spec.account, pool=pool, session_params=session_params)
+    with _locks[name]:
+        meta = read_meta(name)
+        if not force and is_fresh(name):
+            return meta
+        have_snapshot = bool(_segments(name, meta))
+        obsolete = []
+        if spec.watermark and have_snapshot and meta.get("watermark") is not None:
+            since, op = meta["watermark"], ">"
+            rewound = meta.get("rewind") is not None and pd.Timestamp(meta["rewind"]) <= pd.Timestamp(since)
+            if rewound:
+                since, op = meta["rewind"], ">="
+            new = query(
+                f"SELECT * FROM ({spec.query}) WHERE {spec.watermark} {op} %s ORDER BY {spec.watermark}",
+                (since,), output="arrow",
+            )
+            if rewound and new.num_rows:
+                new = _drop_known(name, new, spec, since)
+            meta.pop("rewind", None)
+            if new.num_rows:
+                obsolete = _append(name, meta, new)
+                latest = _max_watermark(new, spec.watermark)
+                # A rewound sync may bring only rows behind the watermark.
+                if latest is not None and (not rewound or pd.Timestamp(latest) > pd.Timestamp(meta["watermark"])):
+                    meta["watermark"] = latest
+                meta["row_count"] = meta.get("row_count", 0) + new.num_rows
+                _run_sync_hooks(name, new, False, query)
+        else:
+            if not spec.watermark and have_snapshot:
+                count = query(f"SELECT COUNT(*) AS N FROM ({spec.query})")
+                unchanged = int(count["N"].iloc[0]) == meta.get("row_count")
+            else:
+                unchanged = False
+            if not unchanged:
+                order = f" ORDER BY {spec.watermark}" if spec.watermark else ""
+                table = query(f"SELECT * FROM ({spec.query}){order}", output="arrow")
+                obsolete = _replace(name, meta, table)
+                meta["row_count"] = table.num_rows
+                if spec.watermark:
+                    meta["watermark"] = _max_watermark(table, spec.watermark)
+                _run_sync_hooks(name, table, True, query)
+        meta["synced_at"] = time.time()
+        _write_meta(name, meta)
+        _unlink(obsolete)
+        return meta
+
+
+def _snapshot_bytes(name):
+    return sum(path.stat().st_size for path in _segments(name))
+
+
+def prune(name, before):
+    """Drop rows of ``name`` whose watermark is older than ``before``.
+
+    Rewrites the snapshot only if something is dropped and returns the bytes
+    reclaimed. Sync hooks don't run: the rows were already seen on the way in.
+    """
+    column = SNAPSHOTS[name].watermark
+    with _locks[name]:
+        if not _segments(name):
+            return 0
+        table = _read_segments(name)
+        kept = table.filter(pc.greater_equal(table[column], pa.scalar(before, type=table.schema.field(column).type)))
+        if kept.num_rows == table.num_rows:
+            return 0
+        size = _snapshot_bytes(name)
+        meta = read_meta(name)
+        obsolete = _replace(name, meta, kept)
+        meta["row_count"] = kept.num_rows
+        _write_meta(name, meta)
+        _unlink(obsolete)
+        return max(0, size - _snapshot_bytes(name))
+
+
+def is_fresh(name):
+    meta = read_meta(name)
+    return bool(_segments(name)) and time.time() - meta.get("synced_at", 0) < SNAPSHOTS[name].max_age
+
+
+@on_invalidate
+def mark_stale(*tables):
+    """Make the next read of these tables start a sync."""
+    for table in tables:
+        name = table.split(".")[-1].upper()
+        if name in SNAPSHOTS and _segments(name):
+            with _locks[name]:
+                meta = read_meta(name)
+                meta["synced_at"] = 0
+                _write_meta(name, meta)
+
+
+_FILTER_OPS = {
+    "=": operator.eq, "==": operator.eq, "!=": operator.ne,
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+}
+
+
+def _apply_filters(df, filters):
+    for column, op, value in filters or []:
+        if op == "in":
+            df = df[df[column].isin(value)]
+        else:
+            df = df[_FILTER_OPS[op](df[column], value)]
+    return df
+
+
+def _backing_off(name):
+    with _state_lock:
+        failure = _failures.get(name)
+    return failure is not None and time.monotonic() < failure[1]
+
+
+def _record_failure(name, error):
+    with _state_lock:
+        failures = _failures.get(name, (0,))[0] + 1
+        delay = min(SYNC_RETRY_MAX, SYNC_RETRY_BASE * 2 ** (failures - 1))
+        _failures[name] = (failures, time.monotonic() + delay, error)
+    logger.warning("Syncing snapshot %s failed (%d in a row), retrying in %ds", name, failures, delay,
+                   exc_info=error)
+
+
+def _sync_and_record(name, pool=None, session_params=None):
+    # Returns the error if the sync failed, recording it for the backoff.
+    try:
+        sync(name, force=False, pool=pool, session_params=session_params)
+    except Exception as e:
+        _record_failure(name, e)
+        return e
+    with _state_lock:
+        _failures.pop(name, None)
+    return None
+
+
+def _sync_in_background(name):
+    with _state_lock:
+        if name in _syncing:
+            return
+        _syncing.add(name)
+    try:
+        # The worker has no session_state: take the session's pool and
+        # context here, as the AQI pipeline does.
+        account = SNAPSHOTS[name].account or st.session_state.account
+        pool = get_pool(account, st.session_state.user, st.session_state.password)
+        session_params = session_params_from_state()
+    except Exception as e:
+        with _state_lock:
+            _syncing.discard(name)
+        _record_failure(name, e)
+        return
+
+    def run():
+        try:
+            _sync_and_record(name, pool, session_params)
+        finally:
+            with _state_lock:
+                _syncing.discard(name)
+
+    threading.Thread(target=run, name=f"snapshot-sync-{name}", daemon=True).start()
+
+
+def _ensure_synced(name):
+    # Start a sync if past the SLA. Returns False if there is neither a
+    # snapshot nor a seed CSV to serve.
+    spec = SNAPSHOTS[name]
+    if is_fresh(name):
+        return True
+    if _segments(name) or spec.seed_csv:
+        # Serve what is on hand; a later read sees the sync's result.
+        if not _backing_off(name):
+            _sync_in_background(name)
+        return True
+    # Nothing to serve, so this read waits for the sync.
+    if _backing_off(name):
+        with _state_lock:
+            error = _failures[name][2]
+    else:
+        error = _sync_and_record(name)
+        if error is None:
+            return True
+    st.error(f"Error syncing snapshot {name}: {str(error)}")
+    return False
+
+
+def read_table(name, columns=None, filters=None):
+    """Read a table from its local snapshot.
+
+    ``columns`` and ``filters`` (pyarrow/pandas ``read_parquet`` style) are
+    pushed down into the Parquet read. A snapshot past its SLA is served as
+    is (or the bundled seed CSV, before the first sync) while a background
+    sync refreshes it; only a table with neither waits for the warehouse.
+    After a failed sync, retries back off so an outage doesn't cost every
+    read a connection attempt.
+    """
+    if not _ensure_synced(name):
+        return None
+    if not _segments(name):
+        df = _apply_filters(pd.read_csv(SNAPSHOTS[name].seed_csv), filters)
+        return df[columns] if columns else df
+    return _read_segments(name, columns=columns, filters=filters).to_pandas()
+
+
+def read_distinct(name, column):
+    """Sorted distinct non-null values of one column, read without the other columns."""
+    if not _ensure_synced(name):
+        return None
+    if not _segments(name):
+        values = pd.read_csv(SNAPSHOTS[name].seed_csv, usecols=[column])[column].dropna().unique()
+        return sorted(values)
+    values = pc.unique(_read_segments(name, columns=[column])[column].combine_chunks())
+    return sorted(v for v in values.to_pylist() if v is not None)
+
+
+def _keyset_filters(filters, key, after, descending):
+    # Rows strictly past ``after`` in (key[0], key[1], ...) order, as DNF:
+    # key[0] past it, or key[0] tied and key[1] past it, and so on.
+    op = "<" if descending else ">"
+    return [
+        list(filters) + [(k, "=", v) for k, v in zip(key[:i], after[:i])] + [(key[i], op, after[i])]
+        for i in range(len(key))
+    ]
+
+
+def _row_groups(name, column):
+    # (path, row group, min, max of ``column``) for every row group of the
+    # snapshot; min and max are None where the writer kept no statistics.
+    groups = []
+    for path in _segments(name):
+        metadata = pq.read_metadata(path)
+        index = metadata.schema.to_arrow_schema().get_field_index(column)
+        for i in range(metadata.num_row_groups):
+            stats = metadata.row_group(i).column(index).statistics
+            bounded = stats is not None and stats.has_min_max
+            groups.append((path, i, stats.min if bounded else None, stats.max if bounded else None))
+    return groups
+
+
+def _read_top(name, key, limit, columns, filters, descending):
+    # The top ``limit`` rows by ``key``, reading row groups from the most
+    # promising end of ``key[0]`` and stopping once no group left can beat
+    # the rows in hand. Retried like _read_segments.
+    order = [(k, "descending" if descending else "ascending") for k in key]
+    filters = [f for f in filters if f]
+    expression = pq.filters_to_expression(filters) if filters else None
+    for attempt in range(3):
+        try:
+            # Descending, the group reaching highest goes first; ascending,
+            # the one reaching lowest. Groups without statistics can't be
+            # ruled out, so they go before all of them.
+            edge = 3 if descending else 2
+            groups = _row_groups(name, key[0])
+            groups = [g for g in groups if g[edge] is None] + sorted(
+                (g for g in groups if g[edge] is not None), key=lambda g: g[edge], reverse=descending,
+            )
+            if not groups:
+                # An empty snapshot: no row groups to pick from.
+                return _read_segments(name, columns=columns, filters=filters or None)
+            files, top = {}, None
+            for n, (path, i, _, _) in enumerate(groups):
+                if path not in files:
+                    files[path] = pq.ParquetFile(path)
+                part = files[path].read_row_group(i, columns=columns)
+                if expression is not None:
+                    part = part.filter(expression)
+                top = part if top is None else pa.concat_tables([top, part])
+                if top.num_rows > limit:
+                    top = top.take(pc.select_k_unstable(top, limit, order))
+                if top.num_rows == limit and n + 1 < len(groups):
+                    worst = (pc.min if descending else pc.max)(top[key[0]]).as_py()
+                    bound = groups[n + 1][edge]
+                    if bound is not None and (worst > bound if descending else worst < bound):
+                        break
+            return top
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+
+
+def read_page(name, key, limit, after=None, columns=None, filters=None, descending=True):
+    """One page of at most ``limit`` rows ordered by ``key``, starting after ``after``.
+
+    Keyset pagination: ``key`` is a column or a list of columns that are
+    unique together within the filtered rows; pass the previous page's last
+    row's values of them as ``after`` (a tuple for several columns). Ties on
+    the leading columns are broken by the later ones, so no row is skipped.
+    Row groups are read from the newest (or, ascending, oldest) ``key[0]``
+    values on, and reading stops once the page is full and no group left
+    can reach past it, so a page reads about one row group's worth of
+    history rather than all of it. That holds while ``key[0]`` roughly
+    follows the order rows were synced in, as a watermark does.
+    """
+    if not _ensure_synced(name):
+        return None
+    key = [key] if isinstance(key, str) else list(key)
+    if columns is not None:
+        columns = [k for k in key if k not in columns] + list(columns)
+    filters = list(filters or [])
+    if after is not None:
+        after = (after,) if len(key) == 1 and not isinstance(after, tuple) else tuple(after)
+        filters = _keyset_filters(filters, key, after, descending)
+    else:
+        filters = [filters]
+    order = [(k, "descending" if descending else "ascending") for k in key]
+    if not _segments(name):
+        df = pd.read_csv(SNAPSHOTS[name].seed_csv)
+        df = pd.concat([_apply_filters(df, conjunction) for conjunction in filters])
+        df = df.sort_values(key, ascending=not descending).head(limit)
+        return df[columns] if columns else df
+    table = _read_top(name, key, limit, columns, filters, descending)
+    return table.sort_by(order).to_pandas()
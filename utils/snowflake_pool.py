@@ -0,0 +1,278 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+import snowflake.connector
+import streamlit as st
+
+from utils.arrow_fetch import fetch_batches, fetch_result
+from utils.query_cache import cache_key, get_query_cache, is_cacheable, referenced_tables
+from utils.single_flight import get_single_flight
+
+# Pool sizing. Every Streamlit session shares the same pool, so this bounds the
+# number of Snowflake sessions the whole app can hold open at once.
+POOL_MAX_SIZE = 8
+# Idle connections older than this are closed instead of being handed out.
+POOL_IDLE_TIMEOUT = 15 * 60
+# Connections idle for longer than this are pinged before being reused.
+POOL_HEALTH_CHECK_INTERVAL = 60
+# How long a caller waits for a free slot before giving up.
+POOL_ACQUIRE_TIMEOUT = 30
+
+# Session context applied on every checkout, in the order Snowflake needs it.
+SESSION_PARAMS = ("role", "warehouse", "database", "schema")
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class SnowflakePool:
+    """Bounded, thread-safe pool of Snowflake connections.
+
+    Connections are checked for health before reuse, reaped once idle for too
+    long, and switched to the caller's role/warehouse/database/schema on
+    checkout so one pool can serve every page.
+    """
+
+    def __init__(self, connect_args, max_size=POOL_MAX_SIZE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 health_check_interval=POOL_HEALTH_CHECK_INTERVAL, acquire_timeout=POOL_ACQUIRE_TIMEOUT):
+        self._connect_args = dict(connect_args)
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._health_check_interval = health_check_interval
+        self._acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        # (connection, last_used) pairs, most recently used on the right.
+        self._idle = deque()
+        # Current session context of every open connection, keyed by id().
+        self._context = {}
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "reaped": 0}
+
+    def _connect(self):
+        conn = snowflake.connector.connect(client_session_keep_alive=True, **self._connect_args)
+        with self._lock:
+            self.stats["created"] += 1
+            self._context[id(conn)] = {}
+        return conn
+
+    def _close(self, conn, reason):
+        with self._lock:
+            self._context.pop(id(conn), None)
+            self.stats[reason] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.is_closed():
+            return False
+        if idle_for < self._health_check_interval:
+            return True
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _apply_session_params(self, conn, session_params):
+        current = self._context.setdefault(id(conn), {})
+        cursor = conn.cursor()
+        try:
+            for name in SESSION_PARAMS:
+                value = session_params.get(name)
+                if value and current.get(name) != value:
+                    cursor.execute(f"USE {name.upper()} IDENTIFIER(%s)", (value,))
+                    current[name] = value
+        finally:
+            cursor.close()
+
+    def reap_idle(self):
+        """Close connections that have sat idle longer than the idle timeout."""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            while self._idle and now - self._idle[0][1] > self._idle_timeout:
+                expired.append(self._idle.popleft()[0])
+        for conn in expired:
+            self._close(conn, "reaped")
+
+    def acquire(self, session_params=None):
+        if not self._slots.acquire(timeout=self._acquire_timeout):
+            raise PoolTimeout(f"No Snowflake connection free after {self._acquire_timeout}s")
+        try:
+            self.reap_idle()
+            conn = None
+            while conn is None:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    conn = self._connect()
+                    break
+                candidate, last_used = entry
+                if self._is_healthy(candidate, time.monotonic() - last_used):
+                    conn = candidate
+                    with self._lock:
+                        self.stats["reused"] += 1
+                else:
+                    self._close(candidate, "discarded")
+            try:
+                self._apply_session_params(conn, session_params or {})
+            except Exception:
+                self._close(conn, "discarded")
+                raise
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        try:
+            if discard or conn.is_closed():
+                self._close(conn, "discarded")
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, session_params=None):
+        conn = self.acquire(session_params)
+        discard = False
+        try:
+            yield conn
+        except Exception:
+            # A failed statement leaves the session usable; only drop it if
+            # the connection itself went away or can't be rolled back.
+            try:
+                if not conn.is_closed():
+                    conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def size(self):
+        with self._lock:
+            return len(self._context)
+
+    def close(self):
+        with self._lock:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._close(conn, "reaped")
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool(account, user, password):
+    return SnowflakePool({"account": account, "user": user, "password": password})
+
+
+def session_params_from_state():
+    return {name: st.session_state.get(name) for name in SESSION_PARAMS}
+
+
+@contextmanager
+def connection(account=None, pool=None, session_params=None):
+    """Check out a pooled connection for the current Streamlit session.
+
+    Off the script thread session_state is empty, so background work passes
+    the ``pool`` and ``session_params`` resolved on it instead.
+    """
+    if pool is None:
+        pool = get_pool(account or st.session_state.account, st.session_state.user, st.session_state.password)
+    if session_params is None:
+        session_params = session_params_from_state()
+    with pool.connection(session_params) as conn:
+        yield conn
+
+
+def _iter_query(query, params, account, dtypes):
+    # The pooled connection stays checked out until the caller has consumed
+    # (or dropped) the batch iterator.
+    try:
+        with connection(account) as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query, params)
+                yield from fetch_batches(cursor, dtypes)
+            finally:
+                cursor.close()
+    except Exception as e:
+        st.error(f"Error executing query: {str(e)}")
+
+
+def _cache_context(account):
+    return {
+        "account": account or st.session_state.account,
+        "role": st.session_state.get("role"),
+        "database": st.session_state.get("database"),
+        "schema": st.session_state.get("schema"),
+    }
+
+
+def run_query(query, params=None, account=None, output="pandas", dtypes=None, pool=None, session_params=None):
+    """Like execute_query, but uncached and raising instead of reporting errors on the page.
+
+    ``pool`` and ``session_params`` are as for ``connection``.
+    """
+    with connection(account, pool, session_params) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            return fetch_result(cursor, output, dtypes)
+        finally:
+            cursor.close()
+
+
+def execute_query(query, params=None, account=None, output="pandas", dtypes=None, cache=True):
+    """Run a query on a pooled connection and fetch the result through Arrow.
+
+    ``output`` selects a pandas DataFrame (default), a pyarrow Table, or
+    ``"batches"`` for an iterator of DataFrames, one per result batch.
+    ``dtypes`` maps column names to Arrow types to cast to. Read-only queries
+    are served from the shared result cache unless ``cache`` is False, and
+    identical ones already running for another session are joined rather
+    than sent to Snowflake again.
+    """
+    if output == "batches":
+        return _iter_query(query, params, account, dtypes)
+    use_cache = cache and is_cacheable(query)
+    if not use_cache:
+        try:
+            return run_query(query, params, account, output, dtypes)
+        except Exception as e:
+            st.error(f"Error executing query: {str(e)}")
+            return None
+
+    query_cache = get_query_cache()
+    key = cache_key(query, params, _cache_context(account), output, dtypes)
+    cached = query_cache.get(key)
+    if cached is not None:
+        return cached
+
+    def run():
+        result = run_query(query, params, account, output, dtypes)
+        query_cache.put(key, result, referenced_tables(query))
+        return result
+
+    try:
+        result, shared = get_single_flight().do(key, run)
+    except Exception as e:
+        st.error(f"Error executing query: {str(e)}")
+        return None
+    # Every session sharing a flight gets the same frame back; give each its own.
+    if shared and isinstance(result, pd.DataFrame):
+        result = result.copy()
+    return result
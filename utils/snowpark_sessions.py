@@ -0,0 +1,136 @@
+import threading
+import time
+
+import streamlit as st
+from snowflake.snowpark.session import Session
+
+from utils.single_flight import get_single_flight
+
+# Sessions nobody has asked for in this long are closed.
+SESSION_IDLE_TIMEOUT = 30 * 60
+# Sessions unused for longer than this are pinged before being handed out.
+SESSION_HEALTH_CHECK_INTERVAL = 60
+
+CONNECTION_PARAMS = ("account", "user", "password", "role", "warehouse", "database", "schema")
+
+
+class SnowparkSessionProvider:
+    """Long-lived Snowpark sessions, one per set of connection parameters.
+
+    Creating a session logs in to Snowflake, which takes seconds, so every
+    rerun of a page gets the same session back instead. A session that has
+    sat unused for a while is pinged first and rebuilt if the ping fails,
+    and sessions idle past the idle timeout are closed.
+    """
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT, health_check_interval=SESSION_HEALTH_CHECK_INTERVAL):
+        self._idle_timeout = idle_timeout
+        self._health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        # key -> (session, last_used)
+        self._sessions = {}
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "reaped": 0}
+
+    @staticmethod
+    def _key(connection_params):
+        return tuple(connection_params.get(name) for name in CONNECTION_PARAMS)
+
+    def _create(self, connection_params):
+        session = Session.builder.configs({**connection_params, "client_session_keep_alive": True}).create()
+        with self._lock:
+            self.stats["created"] += 1
+        return session
+
+    def _close(self, session, reason):
+        with self._lock:
+            self.stats[reason] += 1
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, session, idle_for):
+        if idle_for < self._health_check_interval:
+            return True
+        try:
+            session.sql("SELECT 1").collect()
+            return True
+        except Exception:
+            return False
+
+    def reap_idle(self):
+        """Close sessions that have gone unused longer than the idle timeout."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, last_used) in self._sessions.items() if now - last_used > self._idle_timeout]
+            sessions = [self._sessions.pop(key)[0] for key in expired]
+        for session in sessions:
+            self._close(session, "reaped")
+
+    def get(self, connection_params):
+        """The session for ``connection_params``, creating or replacing it as needed."""
+        self.reap_idle()
+        key = self._key(connection_params)
+        with self._lock:
+            entry = self._sessions.get(key)
+        if entry is not None:
+            session, last_used = entry
+            if self._is_healthy(session, time.monotonic() - last_used):
+                with self._lock:
+                    self._sessions[key] = (session, time.monotonic())
+                    self.stats["reused"] += 1
+                return session
+            with self._lock:
+                if self._sessions.get(key, (None,))[0] is session:
+                    del self._sessions[key]
+            self._close(session, "discarded")
+
+        def create():
+            with self._lock:
+                entry = self._sessions.get(key)
+            if entry is not None:
+                return entry[0]
+            session = self._create(connection_params)
+            with self._lock:
+                self._sessions[key] = (session, time.monotonic())
+            return session
+
+        # Reruns that arrive while the session is being built wait for it.
+        session, _ = get_single_flight().do(("snowpark-session",) + key, create)
+        return session
+
+    def discard(self, connection_params):
+        """Drop the session for ``connection_params``, e.g. after it failed mid-query."""
+        with self._lock:
+            entry = self._sessions.pop(self._key(connection_params), None)
+        if entry is not None:
+            self._close(entry[0], "discarded")
+
+    def size(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def close(self):
+        with self._lock:
+            sessions = [session for session, _ in self._sessions.values()]
+            self._sessions.clear()
+        for session in sessions:
+            self._close(session, "reaped")
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_provider():
+    return SnowparkSessionProvider()
+
+
+def get_session(database=None, schema=None):
+    """The shared Snowpark session for the logged-in user.
+
+    ``database`` and ``schema`` override the ones chosen at login.
+    """
+    connection_params = {name: st.session_state.get(name) for name in CONNECTION_PARAMS}
+    if database:
+        connection_params["database"] = database
+    if schema:
+        connection_params["schema"] = schema
+    return get_session_provider().get(connection_params)